@@ -0,0 +1,70 @@
+"""Delivery benchmark against the local fake Bot API.
+
+Sends a 10-book listing sequentially (the old behaviour), concurrently and as
+an album through the real rate limiter, with simulated network latency, and
+prints wall-clock times and API call counts as JSON.
+
+    python -m bench.delivery --latency-ms 80 --books 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from telegram.ext import ExtBot  # noqa: E402
+from bench.fake_bot_api import FakeBotAPI  # noqa: E402
+from bot.delivery import TelegramRateLimiter, deliver_books  # noqa: E402
+from bot.keyboards import book_actions  # noqa: E402
+from services.book_cache import BookSnapshot, caption  # noqa: E402
+
+
+async def sequential(bot, chat_id, books):
+    for book in books:
+        await bot.send_document(
+            chat_id=chat_id, document=book.file_id, caption=caption(book), reply_markup=book_actions(book.id)
+        )
+
+
+async def measure(api, name, send):
+    bot = ExtBot('123456:bench', base_url=api.base_url, rate_limiter=TelegramRateLimiter())
+    await bot.initialize()
+    calls_before = len(api.calls)
+    started = time.perf_counter()
+    await send(bot)
+    elapsed = time.perf_counter() - started
+    await bot.shutdown()
+    return {'mode': name, 'seconds': elapsed, 'api_calls': len(api.calls) - calls_before}
+
+
+async def run(args):
+    api = FakeBotAPI(latency_ms=args.latency_ms, flood_every=args.flood_every).start()
+    books = [
+        BookSnapshot(i, f"Book {i}", "Bench", "Fiction", f"file-{i}") for i in range(1, args.books + 1)
+    ]
+    chat_id = 42
+    try:
+        results = [
+            await measure(api, 'sequential', lambda bot: sequential(bot, chat_id, books)),
+            await measure(api, 'concurrent', lambda bot: deliver_books(bot, chat_id, books, mode='concurrent')),
+            await measure(api, 'album', lambda bot: deliver_books(bot, chat_id, books, mode='album')),
+        ]
+    finally:
+        api.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark result delivery against a fake Bot API")
+    parser.add_argument('--books', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=80)
+    parser.add_argument('--flood-every', type=int, default=0)
+    args = parser.parse_args()
+    results = asyncio.run(run(args))
+    print(json.dumps({'benchmark': 'delivery', 'latency_ms': args.latency_ms, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
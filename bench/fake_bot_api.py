@@ -0,0 +1,145 @@
+"""Minimal local stand-in for the Telegram Bot API.
+
+Answers every method under /bot<token>/<method> with a plausible result after
+an optional artificial latency, and can answer a fraction of requests with
+429 Too Many Requests to exercise RetryAfter handling. Point the bot at it
+with TELEGRAM_BASE_URL=http://127.0.0.1:<port>/bot.
+
+    python -m bench.fake_bot_api --port 8081 --latency-ms 80 --flood-every 20
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+BOT_USER = {
+    'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_bot',
+    'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': True,
+}
+
+
+class FakeBotAPI:
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, flood_every=0, retry_after=1):
+        self.latency = latency_ms / 1000
+        self.flood_every = flood_every
+        self.retry_after = retry_after
+        self.calls = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _message(self, chat_id, **extra):
+        return dict({
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+        }, **extra)
+
+    def result_for(self, method, params):
+        try:
+            chat_id = int(params.get('chat_id', 1))
+        except (TypeError, ValueError):
+            chat_id = 1
+        document = {'file_id': str(params.get('document', 'fake')), 'file_unique_id': 'fake'}
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'sendDocument':
+            return self._message(chat_id, document=document)
+        if method == 'sendMediaGroup':
+            media = params.get('media')
+            media = json.loads(media) if isinstance(media, str) else (media or [])
+            return [self._message(chat_id, document=document) for _ in media]
+        if method in ('sendMessage', 'editMessageText', 'editMessageCaption'):
+            return self._message(chat_id, text=str(params.get('text', '')))
+        if method == 'getUpdates':
+            return []
+        return True
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                method = self.path.rstrip('/').rsplit('/', 1)[-1]
+                params = _parse(body, self.headers.get('Content-Type', ''))
+                with api._lock:
+                    api.calls.append((time.monotonic(), method))
+                    flooded = api.flood_every and len(api.calls) % api.flood_every == 0
+                if api.latency:
+                    time.sleep(api.latency)
+                if flooded:
+                    payload = {
+                        'ok': False, 'error_code': 429,
+                        'description': f"Too Many Requests: retry after {api.retry_after}",
+                        'parameters': {'retry_after': api.retry_after},
+                    }
+                    status = 429
+                else:
+                    payload = {'ok': True, 'result': api.result_for(method, params)}
+                    status = 200
+                raw = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            do_GET = do_POST
+
+        return Handler
+
+
+def _parse(body, content_type):
+    if not body:
+        return {}
+    if 'application/json' in content_type:
+        try:
+            return json.loads(body)
+        except ValueError:
+            return {}
+    if 'application/x-www-form-urlencoded' in content_type:
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Telegram Bot API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--flood-every', type=int, default=0, help="answer every Nth call with 429")
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.host, args.port, args.latency_ms, args.flood_every)
+    print(f"Fake Bot API listening on {api.base_url}", flush=True)
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == '__main__':
+    main()
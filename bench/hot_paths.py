@@ -0,0 +1,301 @@
+"""Throughput of the bot's hot paths on a synthetic library.
+
+Generates a library of --books books with reading statuses for --users
+users, plus synthetic PDF, EPUB and MOBI files of varying size, then times
+search_books, get_books_by_category, get_stats, get_random_book,
+update_status, extract_metadata and categorize_book. Before timing, a
+UTF-8 MOBI fixture with a Cyrillic title must extract intact. Runs against a
+throwaway SQLite database unless --database-url points at a PostgreSQL
+database to fill (use an empty, disposable one). Prints JSON tagged with
+the current commit so runs can be compared across commits.
+
+    python -m bench.hot_paths --books 10000
+    python -m bench.hot_paths --books 1000000 --database-url postgresql://localhost/leibniz_bench
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta
+
+WORDS = (
+    "history war empire science physics quantum algorithm python data garden "
+    "love murder detective dragon space galaxy philosophy mind economics market "
+    "cooking kitchen travel island ocean mountain biology evolution music jazz "
+    "poetry winter night city river machine learning network design art"
+).split()
+
+INSERT_BATCH = 10000
+
+
+def title(rng):
+    return ' '.join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(2, 5)))
+
+
+def build_library(ops, categories, books, users, rng):
+    """Insert `books` books and a reading status for ~5% of them per user."""
+    from sqlalchemy import insert
+    from db.models import ReadingStatus, FinishedRollup, StatusEnum
+
+    for start in range(0, books, INSERT_BATCH):
+        ops.save_books([
+            {
+                'title': title(rng), 'author': f"{rng.choice(WORDS).capitalize()} Author",
+                'file_id': f"bench-{i}", 'file_unique_id': f"bench-unique-{i}",
+                'format': rng.choice(('pdf', 'epub')), 'page_count': rng.randint(50, 900),
+                'file_size': rng.randint(10 ** 5, 10 ** 8), 'category': rng.choice(categories),
+                'confidence': rng.random(), 'norm_key': None, 'content_hash': None,
+            }
+            for i in range(start, min(start + INSERT_BATCH, books))
+        ])
+        print(f"Inserted {min(start + INSERT_BATCH, books)}/{books} books", file=sys.stderr, flush=True)
+
+    with ops.session_scope() as session:
+        book_ids = [row[0] for row in session.query(ops.Book.id)]
+    now = datetime.now()
+    rows, finished = [], Counter()
+    for user_id in range(1, users + 1):
+        for book_id in rng.sample(book_ids, max(1, len(book_ids) // 20)):
+            status = rng.choice(list(StatusEnum))
+            started = now - timedelta(days=rng.randint(0, 365))
+            finished_date = started + timedelta(days=rng.randint(1, 60)) if status == StatusEnum.finished else None
+            if finished_date:
+                finished[(user_id, finished_date.strftime('%Y-%m'))] += 1
+            rows.append({
+                'book_id': book_id, 'user_id': user_id, 'status': status,
+                'started_date': started if status != StatusEnum.want_to_read else None,
+                'finished_date': finished_date,
+            })
+    with ops.session_scope() as session:
+        for start in range(0, len(rows), INSERT_BATCH):
+            session.execute(insert(ReadingStatus), rows[start:start + INSERT_BATCH])
+        if finished:
+            session.execute(insert(FinishedRollup), [
+                {'user_id': user_id, 'month': month, 'count': count}
+                for (user_id, month), count in finished.items()
+            ])
+    return book_ids
+
+
+def synthetic_pdf(title, author, pages, padding):
+    """A small valid PDF with an Info dictionary and `pages` pages of `padding` bytes each."""
+    content = b"BT /F1 12 Tf 72 720 Td (" + b"x" * padding + b") Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(pages))
+        + b"] /Count %d >>" % pages,
+        b"<< /Title (" + title.encode() + b") /Author (" + author.encode() + b") >>",
+    ]
+    for i in range(pages):
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R /Info 3 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def synthetic_epub(title, author, chapters, padding):
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, 'w') as epub:
+        epub.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+        epub.writestr('META-INF/container.xml', (
+            '<?xml version="1.0"?><container version="1.0" '
+            'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'
+        ))
+        epub.writestr('OEBPS/content.opf', (
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:title>{title}</dc:title><dc:creator>{author}</dc:creator></metadata></package>'
+        ))
+        for i in range(chapters):
+            epub.writestr(f'OEBPS/chapter{i}.xhtml', f'<html><body><p>{"x" * padding}</p></body></html>')
+    return out.getvalue()
+
+
+def synthetic_mobi(title, author, text_length):
+    """A MOBI file with a UTF-8 full name and EXTH author and no text records."""
+    title, author = title.encode('utf-8'), author.encode('utf-8')
+    exth_record = struct.pack('>II', 100, 8 + len(author)) + author
+    exth = b"EXTH" + struct.pack('>II', 12 + len(exth_record), 1) + exth_record
+
+    mobi = bytearray(232)
+    mobi[0:4] = b"MOBI"
+    struct.pack_into('>III', mobi, 4, len(mobi), 2, 65001)  # header length, type, UTF-8
+    struct.pack_into('>II', mobi, 68, 16 + len(mobi) + len(exth), len(title))  # full name
+    struct.pack_into('>I', mobi, 112, 0x40)  # EXTH present
+    record0 = struct.pack('>HHIHHHH', 1, 0, text_length, 0, 4096, 0, 0) + bytes(mobi) + exth + title
+
+    header = bytearray(78)
+    header[0:5] = b"bench"
+    header[60:68] = b"BOOKMOBI"
+    struct.pack_into('>H', header, 76, 1)
+    return bytes(header) + struct.pack('>II', 78 + 8 + 2, 0) + b"\0\0" + record0
+
+
+def check_mobi(directory):
+    """Exit unless a UTF-8 MOBI fixture's title and author come back intact."""
+    from services.metadata import extract_metadata
+    title, author = "Преступление и наказание", "Фёдор Достоевский"
+    path = os.path.join(directory, "utf8.mobi")
+    with open(path, 'wb') as f:
+        f.write(synthetic_mobi(title, author, text_length=600000))
+    found = extract_metadata(path, "utf8.mobi")
+    if found[:3] != (title, author, 300):
+        sys.exit(f"MOBI metadata check failed: {found!r}")
+
+
+def write_files(directory, count, rng):
+    """`count` PDF, EPUB and MOBI files; PDF and EPUB from a few KB to a few MB."""
+    files = []
+    for i in range(count):
+        size = rng.choice((1, 10, 100))
+        path = os.path.join(directory, f"book{i}.pdf")
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf(title(rng), "Bench Author", pages=size * 3, padding=size * 1000))
+        files.append((path, f"book{i}.pdf"))
+        path = os.path.join(directory, f"book{i}.epub")
+        with open(path, 'wb') as f:
+            f.write(synthetic_epub(title(rng), "Bench Author", chapters=size, padding=size * 3000))
+        files.append((path, f"book{i}.epub"))
+        path = os.path.join(directory, f"book{i}.mobi")
+        with open(path, 'wb') as f:
+            f.write(synthetic_mobi(f"{title(rng)} – Книга {i}", "Bench Author", text_length=size * 100000))
+        files.append((path, f"book{i}.mobi"))
+    return files
+
+
+def measure(fn, iterations):
+    """Call fn(i) `iterations` times and summarize per-call latency."""
+    timings = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+    timings.sort()
+    return {
+        'iterations': iterations,
+        'ops_per_second': iterations / elapsed,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[int(len(timings) * 0.95)] * 1000,
+        'max_ms': timings[-1] * 1000,
+    }
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, tmp):
+    from config import CATEGORIES
+    from db import operations as ops
+    from db.models import StatusEnum
+    from services.metadata import extract_metadata
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    categories = list(CATEGORIES)
+
+    ops.init_db()
+    started = time.perf_counter()
+    book_ids = build_library(ops, categories, args.books, args.users, rng)
+    setup_seconds = time.perf_counter() - started
+    check_mobi(tmp)
+    files = write_files(tmp, args.files, rng)
+
+    n = args.iterations
+    queries = [' '.join(rng.sample(WORDS, rng.randint(1, 2))) for _ in range(n)]
+    statuses = list(StatusEnum)
+    user = lambda i: i % args.users + 1  # noqa: E731
+
+    results = {
+        'search_books': measure(lambda i: ops.search_books(queries[i]), n),
+        'get_books_by_category': measure(lambda i: ops.get_books_by_category(categories[i % len(categories)]), n),
+        'get_stats': measure(lambda i: ops.get_stats(user(i)), n),
+        'get_random_book': measure(lambda i: ops.get_random_book(), n),
+        'get_random_book_category': measure(
+            lambda i: ops.get_random_book(category=categories[i % len(categories)]), n
+        ),
+        'get_random_book_queue': measure(lambda i: ops.get_random_book(user_id=user(i)), n),
+        'update_status': measure(
+            lambda i: ops.update_status(rng.choice(book_ids), user(i), statuses[i % len(statuses)]), n
+        ),
+        'extract_metadata': measure(lambda i: extract_metadata(*files[i % len(files)]), max(n // 10, len(files))),
+    }
+
+    try:
+        from services.nlp import init_model, categorize_book
+        init_model()
+    except Exception as e:
+        results['categorize_book'] = {'skipped': str(e)}
+    else:
+        results['categorize_book'] = measure(lambda i: categorize_book(title(rng), "Bench Author"), n)
+
+    dialect = ops.engine.dialect.name
+    ops.engine.dispose()
+    return {
+        'benchmark': 'hot_paths',
+        'commit': commit(),
+        'python': platform.python_version(),
+        'dialect': dialect,
+        'books': args.books,
+        'users': args.users,
+        'files': len(files),
+        'setup_seconds': setup_seconds,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's hot paths on a synthetic library")
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--files', type=int, default=10, help="synthetic PDF, EPUB and MOBI files of each format")
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--database-url', help="empty, disposable database to fill (default: temporary SQLite)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{tmp}/bench.db"
+        report = run(args, tmp)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
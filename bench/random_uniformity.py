@@ -0,0 +1,85 @@
+"""Statistical check that get_random_book picks uniformly.
+
+Builds a throwaway SQLite library with deliberately sparse ids, draws many
+random books with and without a category filter, and runs a chi-square
+goodness-of-fit test against the uniform distribution. Prints JSON and exits
+non-zero if any p-value falls below --alpha.
+
+    python -m bench.random_uniformity --books 200 --draws 40000
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+from collections import Counter
+
+
+def chi_square_p_value(statistic, dof):
+    """Upper-tail p-value via the Wilson-Hilferty normal approximation."""
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def uniformity(draws, population):
+    counts = Counter(draws)
+    expected = len(draws) / len(population)
+    statistic = sum((counts.get(item, 0) - expected) ** 2 / expected for item in population)
+    dof = len(population) - 1
+    return {'chi2': statistic, 'dof': dof, 'p_value': chi_square_p_value(statistic, dof)}
+
+
+def build_library(ops, books, rng):
+    ids = {}
+    for i in range(books):
+        category = 'Sparse' if i % 7 == 0 else 'Dense'
+        book_id = ops.save_book(
+            title=f"Book {i}", author="Bench", file_id=f"file-{i}", file_unique_id=f"unique-{i}",
+            format='pdf', page_count=1, file_size=1, category=category, confidence=1.0
+        )
+        ids[book_id] = category
+    # Punch holes in the id range so rejection sampling has to retry
+    with ops.session_scope() as session:
+        doomed = [book_id for book_id in ids if rng.random() < 0.5]
+        session.query(ops.Book).filter(ops.Book.id.in_(doomed)).delete(synchronize_session=False)
+    for book_id in doomed:
+        del ids[book_id]
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chi-square test of random book selection")
+    parser.add_argument('--books', type=int, default=200)
+    parser.add_argument('--draws', type=int, default=40000)
+    parser.add_argument('--alpha', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['DATABASE_URL'] = f"sqlite:///{tmp}/random.db"
+        from db import operations as ops
+        ops.init_db()
+        rng = random.Random(args.seed)
+        random.seed(args.seed)
+        ids = build_library(ops, args.books, rng)
+
+        results = {}
+        population = sorted(ids)
+        results['all'] = uniformity(
+            [ops.get_random_book().id for _ in range(args.draws)], population
+        )
+        sparse = sorted(book_id for book_id, category in ids.items() if category == 'Sparse')
+        results['category'] = uniformity(
+            [ops.get_random_book(category='Sparse').id for _ in range(args.draws // 4)], sparse
+        )
+        ops.engine.dispose()
+
+    print(json.dumps({'benchmark': 'random_uniformity', 'alpha': args.alpha, 'results': results}, indent=2))
+    if any(result['p_value'] < args.alpha for result in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
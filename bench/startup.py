@@ -0,0 +1,62 @@
+"""Cold-start benchmark: time to import the bot and build the Application.
+
+Each run happens in a fresh interpreter against a throwaway SQLite database,
+so nothing is cached between runs. Prints JSON; exits non-zero when the
+median exceeds --max-seconds.
+
+    python -m bench.startup --runs 5 --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import bot.main
+t1 = time.perf_counter()
+from telegram.ext import Application
+app = Application.builder().token("123456:bench").post_init(bot.main.on_startup).build()
+t2 = time.perf_counter()
+from db.operations import init_db
+init_db()
+t3 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "build_s": t2 - t1, "init_db_s": t3 - t2, "total_s": t3 - t0}))
+'''
+
+
+def run_once(env):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bot cold-start time")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None, help="fail if median total exceeds this")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, BOT_TOKEN='123456:bench', DATABASE_URL=f"sqlite:///{tmp}/startup.db")
+        runs = [run_once(env) for _ in range(args.runs)]
+
+    report = {
+        'benchmark': 'startup',
+        'runs': args.runs,
+        'median': {key: statistics.median(run[key] for run in runs) for key in runs[0]},
+        'samples': runs,
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.max_seconds is not None and report['median']['total_s'] > args.max_seconds:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Webhook load test: replay synthetic updates against a local bot.
+
+Starts the fake Bot API, launches `python -m bot.main` in webhook mode against
+it with a throwaway SQLite database, POSTs synthetic updates from many chats
+to the webhook and measures how fast they are accepted and how fast the bot
+finishes answering them (one reply per update). The bot's Telegram rate
+limiter is opened up unless --rate-limited is given, so the numbers measure
+update processing rather than the flood-limit token buckets. Prints JSON.
+
+    python -m bench.webhook_load --updates 2000 --chats 200 --text /start
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.fake_bot_api import FakeBotAPI
+
+SECRET = 'load-test-secret'
+REPLY_METHODS = {'sendMessage', 'sendDocument', 'editMessageText', 'editMessageCaption', 'editMessageReplyMarkup'}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_update(update_id, chat_id, text):
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': 'private'},
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Load'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+async def wait_for_port(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("bot did not start listening")
+
+
+async def replay(url, updates, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+    headers = {'X-Telegram-Bot-Api-Secret-Token': SECRET}
+    async with httpx.AsyncClient(timeout=30) as client:
+        async def post(update):
+            async with slots:
+                response = await client.post(url, json=update, headers=headers)
+                response.raise_for_status()
+        await asyncio.gather(*(post(update) for update in updates))
+
+
+async def run(args):
+    api = FakeBotAPI(latency_ms=args.api_latency_ms).start()
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            BOT_TOKEN='123456:load',
+            DATABASE_URL=f"sqlite:///{tmp}/load.db",
+            TELEGRAM_BASE_URL=api.base_url,
+            BOT_MODE='webhook',
+            WEBHOOK_LISTEN='127.0.0.1',
+            WEBHOOK_PORT=str(port),
+            WEBHOOK_PATH='hook',
+            WEBHOOK_URL=f"http://127.0.0.1:{port}/hook",
+            WEBHOOK_SECRET=SECRET,
+            MAX_CONCURRENT_UPDATES=str(args.max_concurrent_updates),
+        )
+        if not args.rate_limited:
+            env.update(
+                RATE_LIMIT_GLOBAL_PER_SECOND='1000000',
+                RATE_LIMIT_CHAT_PER_SECOND='1000000',
+                RATE_LIMIT_CHAT_BURST='1000000',
+            )
+        bot = subprocess.Popen([sys.executable, '-m', 'bot.main'], env=env)
+        try:
+            await wait_for_port(port)
+            updates = [
+                synthetic_update(i, 1000 + i % args.chats, args.text) for i in range(1, args.updates + 1)
+            ]
+            replies_before = sum(1 for _, method in api.calls if method in REPLY_METHODS)
+
+            started = time.perf_counter()
+            await replay(f"http://127.0.0.1:{port}/hook", updates, args.client_concurrency)
+            accepted = time.perf_counter() - started
+
+            deadline = time.monotonic() + args.timeout
+            while time.monotonic() < deadline:
+                replies = sum(1 for _, method in api.calls if method in REPLY_METHODS) - replies_before
+                if replies >= args.updates:
+                    break
+                await asyncio.sleep(0.05)
+            processed = time.perf_counter() - started
+        finally:
+            bot.terminate()
+            bot.wait(timeout=30)
+            api.stop()
+
+    return {
+        'benchmark': 'webhook_load',
+        'updates': args.updates,
+        'chats': args.chats,
+        'max_concurrent_updates': args.max_concurrent_updates,
+        'rate_limited': args.rate_limited,
+        'replies': replies,
+        'accept_seconds': accepted,
+        'process_seconds': processed,
+        'accepted_per_second': args.updates / accepted,
+        'processed_per_second': replies / processed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic updates against a local webhook bot")
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--text', default='/start', help="message text each update carries")
+    parser.add_argument('--max-concurrent-updates', type=int, default=64)
+    parser.add_argument('--client-concurrency', type=int, default=50)
+    parser.add_argument('--api-latency-ms', type=float, default=50)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--rate-limited', action='store_true', help="keep the bot's Telegram flood limits")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Rate-limited, concurrent delivery of book results.
+
+TelegramRateLimiter plugs into python-telegram-bot's rate limiter hook, so
+every Bot API call passes a global token bucket and a per-chat bucket and is
+retried after RetryAfter. deliver_books() sends a result list either as
+concurrent single documents (each with its action buttons) or as media-group
+albums followed by one picker message.
+"""
+import asyncio
+import time
+from telegram import InputMediaDocument
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from config import (
+    DELIVERY_MODE, DELIVERY_CONCURRENCY, RATE_LIMIT_GLOBAL_PER_SECOND,
+    RATE_LIMIT_CHAT_PER_SECOND, RATE_LIMIT_CHAT_BURST, RATE_LIMIT_MAX_RETRIES
+)
+from bot.keyboards import book_actions, book_picker
+from services.book_cache import caption
+
+# Telegram caps a media group at 10 items
+ALBUM_SIZE = 10
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def idle(self):
+        self._refill()
+        return self._tokens >= self.capacity
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TelegramRateLimiter(BaseRateLimiter):
+    def __init__(self, global_rate=RATE_LIMIT_GLOBAL_PER_SECOND, chat_rate=RATE_LIMIT_CHAT_PER_SECOND,
+                 chat_burst=RATE_LIMIT_CHAT_BURST, max_retries=RATE_LIMIT_MAX_RETRIES):
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats = {}
+        self.max_retries = max_retries
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._chats.clear()
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                # Buckets that have refilled carry no state worth keeping
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        attempts = rate_limit_args if isinstance(rate_limit_args, int) else self.max_retries
+        for attempt in range(attempts + 1):
+            if chat_id is not None:
+                await self._chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == attempts:
+                    raise
+                retry_after = e.retry_after
+                if hasattr(retry_after, 'total_seconds'):
+                    retry_after = retry_after.total_seconds()
+                await asyncio.sleep(retry_after + 0.1)
+
+
+async def _send_concurrently(bot, chat_id, books, with_category, concurrency):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(book):
+        async with slots:
+            return await bot.send_document(
+                chat_id=chat_id,
+                document=book.file_id,
+                caption=caption(book, with_category=with_category),
+                reply_markup=book_actions(book.id)
+            )
+
+    return await asyncio.gather(*(send(book) for book in books))
+
+
+async def _send_albums(bot, chat_id, books, with_category):
+    for start in range(0, len(books), ALBUM_SIZE):
+        chunk = books[start:start + ALBUM_SIZE]
+        await bot.send_media_group(chat_id=chat_id, media=[
+            InputMediaDocument(media=book.file_id, caption=caption(book, with_category=with_category))
+            for book in chunk
+        ])
+    # Album items cannot carry buttons, so offer the actions in one message
+    await bot.send_message(chat_id=chat_id, text="Open a book:", reply_markup=book_picker(books))
+
+
+async def deliver_books(bot, chat_id, books, with_category=True, mode=DELIVERY_MODE,
+                        concurrency=DELIVERY_CONCURRENCY):
+    """Send a list of books in about one or two round trips instead of one per book."""
+    if not books:
+        return
+    if mode == 'album' and len(books) > 1:
+        await _send_albums(bot, chat_id, books, with_category)
+    else:
+        await _send_concurrently(bot, chat_id, books, with_category, concurrency)
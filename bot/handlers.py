@@ -1,16 +1,44 @@
-from telegram import Update
+import asyncio
+from telegram import Update, InlineQueryResultCachedDocument
 from telegram.ext import ContextTypes
-from bot.keyboards import main_menu, book_actions, category_keyboard, browse_categories
-from services.nlp import categorize_book
-from services.metadata import extract_metadata
-from db.operations import (
-    save_book, search_books, get_book, get_reading_queue,
+from bot.keyboards import (
+    main_menu, book_actions, category_keyboard, browse_categories, page_nav, book_picker, tag_list
+)
+from services import ingest
+from services.nlp import categorizer
+from services.metadata import parse_filename, dedupe_key
+from bot.delivery import deliver_books
+from services import metrics
+from services.metrics import timed_handler
+from services.vector_index import book_index
+from services import book_cache
+from services.book_cache import caption
+from services.cache import MemoryCache
+from services.title_index import title_index, normalize_query
+from config import INLINE_PAGE_SIZE, INLINE_MAX_RESULTS, INLINE_CACHE_SECONDS, INLINE_CACHE_ITEMS
+from db.async_operations import (
+    search_books, get_reading_queue,
     update_status, get_stats, update_book_category, get_random_book,
-    get_books_by_category, book_exists, get_currently_reading
+    get_books_by_category, book_exists, get_currently_reading,
+    enqueue_job, resolve_duplicate, get_similar_books, get_next_reads,
+    get_tag_counts, get_tag_ids, get_books_by_tags
 )
+from db.operations import Page
 from db.models import StatusEnum
 
+SEARCH_PAGE_SIZE = 5
+# Recent searches per user whose result pages can still be turned
+SEARCH_HISTORY = 20
+# Tags offered by a bare /tags
+TAG_LIST_SIZE = 30
+
+# Ranked snapshots per normalized inline query, so a burst of keystrokes
+# (and scrolling through the results) is answered from memory
+_inline_results = MemoryCache(INLINE_CACHE_ITEMS, INLINE_CACHE_SECONDS)
+metrics.watch_cache('inline', _inline_results)
+
 
+@timed_handler('start')
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Leibniz Book Library\n\n"
@@ -18,11 +46,15 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Commands:\n"
         "/start - Show this message\n"
         "/browse - Browse by category\n"
-        "/reading - Show currently reading",
+        "/reading - Show currently reading\n"
+        "/random [queue|category] - Random book\n"
+        "/tags [tag ...|tag or tag] - Browse by tags\n\n"
+        f"Type @{context.bot.username} and a title or author in any chat to search as you type.",
         reply_markup=main_menu()
     )
 
 
+@timed_handler('browse')
 async def browse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Select a category:",
@@ -30,30 +62,135 @@ async def browse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@timed_handler('reading')
 async def reading_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    books = get_currently_reading(user_id)
+    page = await get_currently_reading(user_id)
 
-    if not books:
+    if not page.books:
         await update.message.reply_text("You're not currently reading any books.")
         return
 
-    await update.message.reply_text(f"Currently reading ({len(books)} books):")
-    for book in books[:10]:
-        await context.bot.send_document(
-            chat_id=update.effective_chat.id,
-            document=book.file_id,
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]",
-            reply_markup=book_actions(book.id)
+    await update.message.reply_text(f"Currently reading ({page.total} books):")
+    await send_page(context, update.effective_chat.id, page, 'reading')
+
+
+async def send_books(context, chat_id, books, with_category=True):
+    await deliver_books(context.bot, chat_id, books, with_category=with_category)
+
+
+async def send_page(context, chat_id, page, kind, arg=''):
+    """Send one page of books followed by Prev/Next buttons if there are more."""
+    await send_books(context, chat_id, page.books, with_category=(kind != 'cat'))
+    nav = page_nav(kind, arg, page.prev_cursor, page.next_cursor)
+    if nav:
+        await context.bot.send_message(chat_id=chat_id, text="More:", reply_markup=nav)
+
+
+def _remember_search(context, text):
+    """Store a search under a short key for its Prev/Next buttons (callback data is capped at 64 bytes)."""
+    searches = context.user_data.setdefault('searches', {})
+    context.user_data['search_seq'] = context.user_data.get('search_seq', 0) + 1
+    key = f"{context.user_data['search_seq']:x}"
+    searches[key] = text
+    while len(searches) > SEARCH_HISTORY:
+        del searches[next(iter(searches))]
+    return key
+
+
+async def _search_page(context, key, offset):
+    text = context.user_data.get('searches', {}).get(key)
+    if text is None:
+        return None  # Expired from the history
+    books = await search_books(text, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+    return Page(
+        books[:SEARCH_PAGE_SIZE],
+        None,
+        str(max(offset - SEARCH_PAGE_SIZE, 0)) if offset else None,
+        str(offset + SEARCH_PAGE_SIZE) if len(books) > SEARCH_PAGE_SIZE else None
+    )
+
+
+async def fetch_page(context, kind, arg, user_id, cursor, direction):
+    if kind == 'cat':
+        return await get_books_by_category(arg, cursor=cursor, direction=direction)
+    if kind == 'queue':
+        return await get_reading_queue(user_id, cursor=cursor, direction=direction)
+    if kind == 'reading':
+        return await get_currently_reading(user_id, cursor=cursor, direction=direction)
+    if kind == 'tag':
+        # arg: 'a' (all tags) or 'o' (any tag) followed by dot-separated tag ids
+        return await get_books_by_tags(
+            [int(tag_id) for tag_id in arg[1:].split('.')], match_all=(arg[0] == 'a'),
+            cursor=cursor, direction=direction
         )
+    if kind == 'search':
+        # Ranked results page by offset; the cursor is the offset itself, arg the search key
+        return await _search_page(context, arg, int(cursor))
+    return None
+
+
+@timed_handler('tags')
+async def tags_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /tags, /tags python war (books with both), /tags python or war (either)
+    words = ' '.join(context.args).lower().replace('|', ' or ').split()
+    names = [word for word in words if word not in ('and', 'or')]
+    if not names:
+        tags = await get_tag_counts()
+        if not tags:
+            await update.message.reply_text("No tagged books yet.")
+            return
+        await update.message.reply_text("Select a tag:", reply_markup=tag_list(tags[:TAG_LIST_SIZE]))
+        return
+
+    tag_ids = await get_tag_ids(names)
+    unknown = [name for name in names if name not in tag_ids]
+    if unknown:
+        await update.message.reply_text(f"Unknown tags: {', '.join(unknown)}")
+        return
+
+    match_all = 'or' not in words
+    arg = ('a' if match_all else 'o') + '.'.join(str(tag_ids[name]) for name in names)
+    page = await fetch_page(context, 'tag', arg, update.effective_user.id, None, 'next')
+    if not page.books:
+        await update.message.reply_text("No books with those tags.")
+        return
+    await update.message.reply_text(
+        f"Tagged {(' + ' if match_all else ' or ').join(names)} ({page.total} books):"
+    )
+    await send_page(context, update.effective_chat.id, page, 'tag', arg)
+
+
+@timed_handler('random')
+async def random_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /random, /random queue, /random <category>
+    choice = ' '.join(context.args)
+    if not choice:
+        book = await get_random_book()
+    elif choice.lower() == 'queue':
+        book = await get_random_book(user_id=update.effective_user.id)
+    else:
+        book = await get_random_book(category=choice)
+
+    if not book:
+        await update.message.reply_text("No matching books found!")
+        return
+
+    await context.bot.send_document(
+        chat_id=update.effective_chat.id,
+        document=book.file_id,
+        caption=caption(book),
+        reply_markup=book_actions(book.id)
+    )
 
 
+@timed_handler('document')
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     document = update.message.document
     filename = document.file_name or "unknown"
 
     # Check supported formats
-    supported = ['.pdf', '.epub', '.mobi', '.azw3']
+    supported = ['.pdf', '.epub', '.mobi', '.azw3', '.fb2']
     if not any(filename.lower().endswith(ext) for ext in supported):
         await update.message.reply_text(
             f"Unsupported format. Please send: {', '.join(supported)}"
@@ -61,84 +198,53 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Check if already exists
-    if book_exists(document.file_unique_id):
+    if await book_exists(document.file_unique_id):
         await update.message.reply_text("This book is already in your library!")
         return
 
     status_msg = await update.message.reply_text("Processing book...")
 
-    # Get Telegram file references
-    file_id = document.file_id
-    file_unique_id = document.file_unique_id
-    file_size = document.file_size
-
-    # Download to memory for metadata extraction
-    try:
-        file = await document.get_file()
-        file_bytes = await file.download_as_bytearray()
-    except Exception as e:
-        await status_msg.edit_text(f"Failed to download file: {e}")
-        return
-
-    # Extract metadata
-    title, author, pages, format = extract_metadata(bytes(file_bytes), filename)
-
-    if not title:
-        title = filename
-
-    # Auto-categorize
-    await status_msg.edit_text("Categorizing...")
-    category, confidence = categorize_book(title, author)
-
-    # Save to DB
-    book_id = save_book(
-        title=title,
-        author=author,
-        file_id=file_id,
-        file_unique_id=file_unique_id,
-        format=format,
-        page_count=pages,
-        file_size=file_size,
-        category=category,
-        confidence=confidence
-    )
-
-    # Confirm
-    await status_msg.edit_text(
-        f"Added: {title}\n"
-        f"Author: {author or 'Unknown'}\n"
-        f"Category: {category} ({confidence:.0%})\n"
-        f"Pages: {pages or 'N/A'}",
-        reply_markup=book_actions(book_id)
+    # Queue it; an ingest worker edits status_msg with the result
+    await enqueue_job(
+        chat_id=status_msg.chat_id,
+        user_id=update.effective_user.id,
+        status_message_id=status_msg.message_id,
+        file_id=document.file_id,
+        file_unique_id=document.file_unique_id,
+        file_name=filename,
+        file_size=document.file_size,
+        norm_key=dedupe_key(*parse_filename(filename))
     )
+    ingest.notify()
 
 
+@timed_handler('text')
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text
 
     if text == 'Search':
         await update.message.reply_text("Enter search term:")
         context.user_data['awaiting_search'] = True
+        context.user_data['awaiting_semantic'] = False
+
+    elif text == 'By Meaning':
+        await update.message.reply_text("Describe the book you're looking for:")
+        context.user_data['awaiting_semantic'] = True
+        context.user_data['awaiting_search'] = False
 
     elif text == 'Queue':
         user_id = update.effective_user.id
-        books = get_reading_queue(user_id)
+        page = await get_reading_queue(user_id)
 
-        if not books:
+        if not page.books:
             await update.message.reply_text("Your reading queue is empty!")
             return
 
-        await update.message.reply_text(f"Reading queue ({len(books)} books):")
-        for book in books[:10]:
-            await context.bot.send_document(
-                chat_id=update.effective_chat.id,
-                document=book.file_id,
-                caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]",
-                reply_markup=book_actions(book.id)
-            )
+        await update.message.reply_text(f"Reading queue ({page.total} books):")
+        await send_page(context, update.effective_chat.id, page, 'queue')
 
     elif text == 'Random':
-        book = get_random_book()
+        book = await get_random_book()
         if not book:
             await update.message.reply_text("No books in library yet!")
             return
@@ -146,39 +252,57 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await context.bot.send_document(
             chat_id=update.effective_chat.id,
             document=book.file_id,
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]",
+            caption=caption(book),
             reply_markup=book_actions(book.id)
         )
 
     elif text == 'Stats':
         user_id = update.effective_user.id
-        total, reading, finished, queue = get_stats(user_id)
-        await update.message.reply_text(
-            f"Library Stats\n\n"
-            f"Total books: {total}\n"
-            f"Currently reading: {reading}\n"
-            f"Finished: {finished}\n"
-            f"In queue: {queue}"
-        )
+        stats = await get_stats(user_id)
+        lines = [
+            "Library Stats\n",
+            f"Total books: {stats.total}",
+            f"Currently reading: {stats.reading}",
+            f"Finished: {stats.finished}",
+            f"In queue: {stats.queue}",
+        ]
+        if stats.by_category:
+            lines.append("\nBy category:")
+            for category, count in sorted(stats.by_category.items(), key=lambda item: -item[1]):
+                lines.append(f"{category or 'Uncategorized'}: {count}")
+        if stats.finished_by_month:
+            lines.append("\nFinished per month:")
+            for month, count in stats.finished_by_month:
+                lines.append(f"{month}: {count}")
+        await update.message.reply_text("\n".join(lines))
 
     elif context.user_data.get('awaiting_search'):
         context.user_data['awaiting_search'] = False
-        books = search_books(text)
+        key = _remember_search(context, text)
+        page = await _search_page(context, key, 0)
+
+        if not page.books:
+            await update.message.reply_text(f"No books found for '{text}'")
+            return
+
+        await update.message.reply_text(f"Best matches for '{text}':")
+        await send_page(context, update.effective_chat.id, page, 'search', key)
+
+    elif context.user_data.get('awaiting_semantic'):
+        context.user_data['awaiting_semantic'] = False
+        query_embedding = await categorizer.embed(text)
+        matches = await asyncio.to_thread(book_index.search, query_embedding, 5)
+        books = await book_cache.get_book_snapshots([book_id for book_id, _ in matches])
 
         if not books:
             await update.message.reply_text(f"No books found for '{text}'")
             return
 
-        await update.message.reply_text(f"Found {len(books)} book(s):")
-        for book in books[:5]:
-            await context.bot.send_document(
-                chat_id=update.effective_chat.id,
-                document=book.file_id,
-                caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]",
-                reply_markup=book_actions(book.id)
-            )
+        await update.message.reply_text(f"Closest in meaning to '{text}':")
+        await send_books(context, update.effective_chat.id, books)
 
 
+@timed_handler('callback')
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -194,58 +318,133 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         parts = data.split('_')
         book_id = int(parts[1])
         category = '_'.join(parts[2:])  # Handle categories with underscores
-        update_book_category(book_id, category)
-        book = get_book(book_id)
+        book = await book_cache.put(await update_book_category(book_id, category))
         await query.edit_message_caption(
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{category}]",
+            caption=caption(book),
             reply_markup=book_actions(book_id)
         )
 
     elif data.startswith('cancel_'):
         book_id = int(data.split('_')[1])
-        book = get_book(book_id)
         await query.edit_message_reply_markup(reply_markup=book_actions(book_id))
 
     elif data.startswith('queue_'):
         book_id = int(data.split('_')[1])
-        update_status(book_id, user_id, StatusEnum.want_to_read)
-        book = get_book(book_id)
+        book = await update_status(book_id, user_id, StatusEnum.want_to_read)
         await query.edit_message_caption(
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]\n\n[Added to queue]",
+            caption=caption(book, "Added to queue"),
             reply_markup=book_actions(book_id)
         )
 
     elif data.startswith('read_'):
         book_id = int(data.split('_')[1])
-        update_status(book_id, user_id, StatusEnum.reading)
-        book = get_book(book_id)
+        book = await update_status(book_id, user_id, StatusEnum.reading)
         await query.edit_message_caption(
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]\n\n[Currently reading]",
+            caption=caption(book, "Currently reading"),
             reply_markup=book_actions(book_id)
         )
 
     elif data.startswith('done_'):
         book_id = int(data.split('_')[1])
-        update_status(book_id, user_id, StatusEnum.finished)
-        book = get_book(book_id)
+        book = await update_status(book_id, user_id, StatusEnum.finished)
         await query.edit_message_caption(
-            caption=f"{book.title}\nby {book.author or 'Unknown'}\n[{book.category}]\n\n[Finished]",
+            caption=caption(book, "Finished"),
             reply_markup=book_actions(book_id)
         )
+        suggestions = await get_next_reads(book_id, user_id)
+        if suggestions:
+            await query.message.reply_text("Read next?", reply_markup=book_picker(suggestions))
+
+    elif data.startswith('tag_'):
+        arg = 'a' + data.split('_')[1]
+        page = await fetch_page(context, 'tag', arg, user_id, None, 'next')
+        await query.edit_message_text(f"{page.total} books with this tag:")
+        await send_page(context, update.effective_chat.id, page, 'tag', arg)
+
+    elif data.startswith('sim_'):
+        book_id = int(data.split('_')[1])
+        similar = await get_similar_books(book_id)
+        if similar:
+            await query.message.reply_text("Similar books:", reply_markup=book_picker(similar))
+        else:
+            await query.message.reply_text("No similar books yet.")
 
     elif data.startswith('browse_'):
         category = data.replace('browse_', '')
-        books = get_books_by_category(category)
+        page = await get_books_by_category(category)
 
-        if not books:
+        if not page.books:
             await query.edit_message_text(f"No books in '{category}' category.")
             return
 
-        await query.edit_message_text(f"Books in '{category}' ({len(books)}):")
-        for book in books[:10]:
+        await query.edit_message_text(f"Books in '{category}' ({page.total}):")
+        await send_page(context, update.effective_chat.id, page, 'cat', category)
+
+    elif data.startswith('page_'):
+        # page_<kind>_<p|n>_<cursor>_<arg>; arg may contain underscores
+        _, kind, direction, cursor, arg = data.split('_', 4)
+        page = await fetch_page(
+            context, kind, arg, user_id, cursor, 'prev' if direction == 'p' else 'next'
+        )
+        # The new page's buttons go below it, so retire the old ones
+        await query.edit_message_reply_markup(reply_markup=None)
+        if page and page.books:
+            await send_page(context, update.effective_chat.id, page, kind, arg)
+
+    elif data.startswith('show_'):
+        book_id = int(data.split('_')[1])
+        book = await book_cache.get_book_snapshot(book_id)
+        if book:
             await context.bot.send_document(
                 chat_id=update.effective_chat.id,
                 document=book.file_id,
-                caption=f"{book.title}\nby {book.author or 'Unknown'}",
+                caption=caption(book),
                 reply_markup=book_actions(book.id)
             )
+
+    elif data.startswith('dupmerge_') or data.startswith('dupkeep_'):
+        # dupmerge_<job id>_<existing book id> / dupkeep_<job id>
+        parts = data.split('_')
+        keep = parts[0] == 'dupkeep'
+        if not await resolve_duplicate(int(parts[1]), user_id, keep):
+            await query.edit_message_text("This upload was already handled.")
+        elif keep:
+            await query.edit_message_text("Processing book...")
+            ingest.notify()
+        else:
+            book = await book_cache.get_book_snapshot(int(parts[2]))
+            if book:
+                await query.edit_message_text(
+                    f"Kept the copy already in your library:\n\n{caption(book)}",
+                    reply_markup=book_actions(book.id)
+                )
+            else:
+                await query.edit_message_text("Book not found")
+
+
+@timed_handler('inline')
+async def handle_inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    key = normalize_query(query.query)
+    books = _inline_results.get(key)
+    if books is None:
+        book_ids = await asyncio.to_thread(title_index.search, key, INLINE_MAX_RESULTS)
+        books = await book_cache.get_book_snapshots(book_ids)
+        _inline_results.set(key, books)
+
+    offset = int(query.offset or 0)
+    end = offset + INLINE_PAGE_SIZE
+    await query.answer(
+        [
+            InlineQueryResultCachedDocument(
+                id=str(book.id),
+                title=book.title,
+                document_file_id=book.file_id,
+                description=f"by {book.author or 'Unknown'}",
+                caption=caption(book)
+            )
+            for book in books[offset:end]
+        ],
+        cache_time=INLINE_CACHE_SECONDS,
+        next_offset=str(end) if len(books) > end else ''
+    )
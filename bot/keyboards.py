@@ -4,8 +4,8 @@ from config import CATEGORIES
 
 def main_menu():
     return ReplyKeyboardMarkup([
-        ['Search', 'Queue'],
-        ['Random', 'Stats']
+        ['Search', 'By Meaning'],
+        ['Queue', 'Random', 'Stats']
     ], resize_keyboard=True)
 
 
@@ -16,7 +16,10 @@ def book_actions(book_id):
             InlineKeyboardButton("Add to Queue", callback_data=f"queue_{book_id}"),
             InlineKeyboardButton("Start Reading", callback_data=f"read_{book_id}")
         ],
-        [InlineKeyboardButton("Mark Finished", callback_data=f"done_{book_id}")]
+        [
+            InlineKeyboardButton("Mark Finished", callback_data=f"done_{book_id}"),
+            InlineKeyboardButton("Similar Books", callback_data=f"sim_{book_id}")
+        ]
     ])
 
 
@@ -36,3 +39,37 @@ def browse_categories():
     ]
     buttons.append([InlineKeyboardButton("Uncategorized", callback_data="browse_Uncategorized")])
     return InlineKeyboardMarkup(buttons)
+
+
+def tag_list(tags):
+    """Two tag buttons per row, each with its book count."""
+    buttons = [
+        InlineKeyboardButton(f"{name} ({count})", callback_data=f"tag_{tag_id}")
+        for tag_id, name, count in tags
+    ]
+    return InlineKeyboardMarkup([buttons[i:i + 2] for i in range(0, len(buttons), 2)])
+
+
+def page_nav(kind, arg, prev_cursor, next_cursor):
+    """Prev/Next buttons carrying the page cursor in the callback data."""
+    buttons = []
+    if prev_cursor:
+        buttons.append(InlineKeyboardButton("« Prev", callback_data=f"page_{kind}_p_{prev_cursor}_{arg}"))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton("Next »", callback_data=f"page_{kind}_n_{next_cursor}_{arg}"))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def book_picker(books):
+    """One button per book, used under albums whose items cannot carry buttons."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(book.title[:60], callback_data=f"show_{book.id}")]
+        for book in books
+    ])
+
+
+def duplicate_choice(token, book_id):
+    return InlineKeyboardMarkup([[
+        InlineKeyboardButton("Merge", callback_data=f"dupmerge_{token}_{book_id}"),
+        InlineKeyboardButton("Keep both", callback_data=f"dupkeep_{token}")
+    ]])
@@ -1,9 +1,80 @@
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+import asyncio
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, filters
+)
 from bot.handlers import (
     start, handle_document, handle_text, handle_callback,
-    browse_command, reading_command
+    browse_command, reading_command, random_command, tags_command, handle_inline_query
+)
+from config import (
+    BOT_TOKEN, TELEGRAM_BASE_URL, BOT_MODE, MAX_CONCURRENT_UPDATES,
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    METRICS_HOST, METRICS_PORT, INGEST_BOT_WORKERS, INLINE_SYNC_SECONDS
 )
-from config import BOT_TOKEN
+from bot.update_processor import PerChatUpdateProcessor
+from bot.delivery import TelegramRateLimiter
+from db import async_operations
+from db.operations import engine
+from services import metrics
+from services.extraction import extraction_pool
+from services import download
+from services.nlp import categorizer
+from services.vector_index import load_book_index
+from services.title_index import load_title_index, sync_title_index
+from services.ingest import work, sync_vectors
+
+
+def _report_warm_up(future):
+    if future.cancelled():
+        return
+    if future.exception():
+        print(f"Model warm-up failed: {future.exception()}", flush=True)
+    else:
+        print("Language model ready", flush=True)
+
+
+async def _load_vectors():
+    count = await asyncio.to_thread(load_book_index)
+    print(f"Loaded {count} book vectors", flush=True)
+    # Then pick up books saved by separate ingest workers
+    await sync_vectors()
+
+
+async def _load_titles():
+    count = await asyncio.to_thread(load_title_index)
+    print(f"Indexed {count} titles for inline search", flush=True)
+    while True:
+        await asyncio.sleep(INLINE_SYNC_SECONDS)
+        try:
+            await asyncio.to_thread(sync_title_index)
+        except Exception as e:
+            print(f"Title index sync failed: {e}", flush=True)
+
+
+async def on_startup(app):
+    await async_operations.init_db()
+    # Load the model in the background so /start is answered immediately
+    warm_up = categorizer.warm_up()
+    warm_up.add_done_callback(_report_warm_up)
+    app.bot_data['model_warm_up'] = warm_up
+    app.bot_data['background'] = [asyncio.create_task(_load_vectors()), asyncio.create_task(_load_titles())] + [
+        asyncio.create_task(work(app.bot, f"bot-{i}")) for i in range(INGEST_BOT_WORKERS)
+    ]
+
+
+async def on_stop(app):
+    # Before the bot shuts down, so interrupted ingest jobs are handed back cleanly
+    tasks = app.bot_data.get('background', [])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def on_shutdown(app):
+    await download.close()
+    categorizer.shutdown()
+    extraction_pool.shutdown()
+    async_operations.shutdown()
 
 
 def main():
@@ -11,12 +82,33 @@ def main():
         print("Error: BOT_TOKEN not set in .env file")
         return
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    metrics.instrument_engine(engine)
+    if METRICS_PORT:
+        metrics.start_server(METRICS_HOST, METRICS_PORT)
+        print(f"Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics", flush=True)
+
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .request(metrics.telegram_request(connection_pool_size=256))
+        .get_updates_request(metrics.telegram_request())
+        .rate_limiter(TelegramRateLimiter())
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .post_shutdown(on_shutdown)
+    )
+    if TELEGRAM_BASE_URL:
+        builder = builder.base_url(TELEGRAM_BASE_URL)
+    if MAX_CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerChatUpdateProcessor(MAX_CONCURRENT_UPDATES))
+    app = builder.build()
 
     # Command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("browse", browse_command))
     app.add_handler(CommandHandler("reading", reading_command))
+    app.add_handler(CommandHandler("random", random_command))
+    app.add_handler(CommandHandler("tags", tags_command))
 
     # Document handler (for book files)
     app.add_handler(MessageHandler(filters.Document.ALL, handle_document))
@@ -27,9 +119,21 @@ def main():
     # Callback handler (for inline buttons)
     app.add_handler(CallbackQueryHandler(handle_callback))
 
-    print("Leibniz bot started!", flush=True)
+    # Inline queries (@bot title) for search as you type
+    app.add_handler(InlineQueryHandler(handle_inline_query))
+
+    print(f"Leibniz bot started ({BOT_MODE})!", flush=True)
     print("Press Ctrl+C to stop", flush=True)
-    app.run_polling()
+    if BOT_MODE == 'webhook':
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET
+        )
+    else:
+        app.run_polling()
 
 
 if __name__ == '__main__':
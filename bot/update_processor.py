@@ -0,0 +1,51 @@
+import asyncio
+from telegram.ext import BaseUpdateProcessor
+
+
+def ordering_key(update):
+    """Updates sharing a key are handled one at a time, in arrival order."""
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        # Inline queries and the like have a user but no chat
+        return ('user', update.effective_user.id)
+    return None
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Process updates concurrently while keeping each chat's updates in order.
+
+    A slow handler (say, a large upload) only holds up later updates from the
+    same chat; everyone else's button presses keep flowing.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # key -> [asyncio.Lock, number of updates holding or waiting]
+
+    async def process_update(self, update, coroutine):
+        # The base class takes a concurrency slot before do_process_update, so
+        # updates queued behind a busy chat would hold every slot while they
+        # wait. Wait for the chat first and take a slot only to run.
+        key = ordering_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._locks.clear()
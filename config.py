@@ -6,6 +6,103 @@ load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# 'polling' or 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # public URL Telegram posts to
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Updates handled at once; updates from one chat are still processed in order.
+# 1 restores strictly sequential processing.
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', 64))
+
+# Connection pool; the async DB layer runs one thread per pooled connection
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+
+# Metadata extraction process pool
+EXTRACT_WORKERS = int(os.getenv('EXTRACT_WORKERS', os.cpu_count() or 2))
+EXTRACT_TIMEOUT = float(os.getenv('EXTRACT_TIMEOUT', 15))
+EXTRACT_MEMORY_MB = int(os.getenv('EXTRACT_MEMORY_MB', 512))
+EXTRACT_MAX_TASKS_PER_WORKER = int(os.getenv('EXTRACT_MAX_TASKS_PER_WORKER', 50))
+EXTRACT_QUEUE_SIZE = int(os.getenv('EXTRACT_QUEUE_SIZE', 2 * EXTRACT_WORKERS))
+
+# Forwarded books are queued in the database and processed by ingest workers:
+# INGEST_BOT_WORKERS run inside the bot (0 when only `python -m services.worker`
+# processes should do the work)
+INGEST_BOT_WORKERS = int(os.getenv('INGEST_BOT_WORKERS', 4))
+INGEST_POLL_SECONDS = float(os.getenv('INGEST_POLL_SECONDS', 2))
+INGEST_LEASE_SECONDS = int(os.getenv('INGEST_LEASE_SECONDS', 300))
+INGEST_MAX_ATTEMPTS = int(os.getenv('INGEST_MAX_ATTEMPTS', 3))
+INGEST_RETRY_SECONDS = int(os.getenv('INGEST_RETRY_SECONDS', 30))
+# How often the search-by-meaning index picks up books saved by other processes
+VECTOR_SYNC_SECONDS = int(os.getenv('VECTOR_SYNC_SECONDS', 30))
+
+# Inline search (@bot query): results per answer (Telegram allows 50), ranked
+# results kept per query, and how long a query's results are reused, here and
+# by Telegram; the title index picks up books saved elsewhere every
+# INLINE_SYNC_SECONDS
+INLINE_PAGE_SIZE = min(int(os.getenv('INLINE_PAGE_SIZE', 20)), 50)
+INLINE_MAX_RESULTS = int(os.getenv('INLINE_MAX_RESULTS', 100))
+INLINE_CACHE_SECONDS = int(os.getenv('INLINE_CACHE_SECONDS', 30))
+INLINE_CACHE_ITEMS = int(os.getenv('INLINE_CACHE_ITEMS', 1000))
+INLINE_SYNC_SECONDS = int(os.getenv('INLINE_SYNC_SECONDS', 30))
+
+# Categorization batching: requests within the window share one encode call
+NLP_BATCH_WINDOW_MS = int(os.getenv('NLP_BATCH_WINDOW_MS', 20))
+NLP_MAX_BATCH = int(os.getenv('NLP_MAX_BATCH', 64))
+NLP_TOP_K = int(os.getenv('NLP_TOP_K', 3))
+
+# 'title' categorizes from title and author; 'content' also embeds a text
+# sample from the first SAMPLE_PAGES PDF pages or SAMPLE_SPINE_ITEMS EPUB
+# chapters, capped at SAMPLE_MAX_BYTES read, SAMPLE_MAX_CHARS of text and
+# SAMPLE_SECONDS per book, split into SAMPLE_CHUNK_CHARS chunks
+CATEGORIZE_FROM = os.getenv('CATEGORIZE_FROM', 'title')
+SAMPLE_PAGES = int(os.getenv('SAMPLE_PAGES', 5))
+SAMPLE_SPINE_ITEMS = int(os.getenv('SAMPLE_SPINE_ITEMS', 3))
+SAMPLE_MAX_BYTES = int(os.getenv('SAMPLE_MAX_BYTES', 512 * 1024))
+SAMPLE_MAX_CHARS = int(os.getenv('SAMPLE_MAX_CHARS', 8000))
+SAMPLE_SECONDS = float(os.getenv('SAMPLE_SECONDS', 2))
+SAMPLE_CHUNK_CHARS = int(os.getenv('SAMPLE_CHUNK_CHARS', 1000))
+
+# In-memory vector index used by "search by meaning"
+VECTOR_INDEX_BACKEND = os.getenv('VECTOR_INDEX_BACKEND', 'bruteforce')
+
+# Similar books kept per book in the precomputed similarity graph
+NEIGHBOR_COUNT = int(os.getenv('NEIGHBOR_COUNT', 10))
+
+# Cosine similarity of title/author embeddings above which a new book is
+# offered as a possible duplicate
+DUPLICATE_SIMILARITY = float(os.getenv('DUPLICATE_SIMILARITY', 0.97))
+
+# Book snapshot cache: 'memory' (per process) or 'redis' (shared)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ITEMS = int(os.getenv('CACHE_MAX_ITEMS', 10000))
+CACHE_TTL = int(os.getenv('CACHE_TTL', 3600))
+
+# Result delivery: 'concurrent' single documents or 'album' media groups
+DELIVERY_MODE = os.getenv('DELIVERY_MODE', 'concurrent')
+DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', 5))
+
+# Telegram flood limits; every Bot API call goes through these buckets
+RATE_LIMIT_GLOBAL_PER_SECOND = float(os.getenv('RATE_LIMIT_GLOBAL_PER_SECOND', 30))
+RATE_LIMIT_CHAT_PER_SECOND = float(os.getenv('RATE_LIMIT_CHAT_PER_SECOND', 1))
+RATE_LIMIT_CHAT_BURST = int(os.getenv('RATE_LIMIT_CHAT_BURST', 20))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 3))
+
+# Prometheus-format /metrics endpoint (0 disables it), and the duration above
+# which handlers, ingestion stages, queries and API calls are logged
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+SLOW_OP_MS = float(os.getenv('SLOW_OP_MS', 1000))
+
+# Bot API endpoint override, e.g. a local Bot API server or bench/fake_bot_api.py
+TELEGRAM_BASE_URL = os.getenv('TELEGRAM_BASE_URL')
+
 CATEGORIES = {
     "Fiction": "novel story fiction narrative plot character literary",
     "Technical": "programming code software engineering computer algorithm",
@@ -15,3 +112,23 @@ CATEGORIES = {
     "Business": "business management economics finance marketing strategy",
     "Self-Help": "self-help motivation productivity habits personal"
 }
+
+# Automatic tags: name -> comma-separated keyword phrases. A book gets a tag
+# when the name (hyphens as spaces) or one of the phrases appears as whole
+# words in its title or author, or when its embedding is at least
+# TAG_THRESHOLD similar to the keywords. Keep phrases specific: a single
+# generic word ("life", "future") tags every title that contains it
+TAG_VOCABULARY = {
+    "python": "python, python programming",
+    "machine-learning": "machine learning, neural networks, deep learning, artificial intelligence",
+    "mathematics": "mathematics, algebra, calculus, geometry, statistics",
+    "startups": "startup, startups, founders, entrepreneurship, venture capital",
+    "psychology": "psychology, cognitive psychology, behavioral science",
+    "classics": "classic literature, tolstoy, dostoevsky, austen",
+    "science-fiction": "science fiction, sci-fi, space opera, robots",
+    "biography": "biography, memoir, memoirs, autobiography",
+    "war": "war, military history, battle, army",
+    "economics": "economics, economy, macroeconomics, microeconomics"
+}
+TAG_THRESHOLD = float(os.getenv('TAG_THRESHOLD', 0.45))
+MAX_TAGS_PER_BOOK = int(os.getenv('MAX_TAGS_PER_BOOK', 5))
@@ -0,0 +1,56 @@
+"""Awaitable versions of db.operations for use inside bot handlers.
+
+Each call runs in a dedicated thread pool sized to the connection pool, so a
+slow query only occupies one worker thread instead of the event loop.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW
+from db import operations
+
+_executor = ThreadPoolExecutor(
+    max_workers=DB_POOL_SIZE + DB_MAX_OVERFLOW,
+    thread_name_prefix='db'
+)
+
+
+def _awaitable(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+init_db = _awaitable(operations.init_db)
+save_book = _awaitable(operations.save_book)
+search_books = _awaitable(operations.search_books)
+get_book = _awaitable(operations.get_book)
+get_books = _awaitable(operations.get_books)
+get_books_by_category = _awaitable(operations.get_books_by_category)
+get_random_book = _awaitable(operations.get_random_book)
+get_reading_queue = _awaitable(operations.get_reading_queue)
+get_currently_reading = _awaitable(operations.get_currently_reading)
+update_status = _awaitable(operations.update_status)
+update_book_category = _awaitable(operations.update_book_category)
+get_stats = _awaitable(operations.get_stats)
+book_exists = _awaitable(operations.book_exists)
+find_duplicates = _awaitable(operations.find_duplicates)
+find_by_content_hash = _awaitable(operations.find_by_content_hash)
+find_embeddings = _awaitable(operations.find_embeddings)
+get_similar_books = _awaitable(operations.get_similar_books)
+get_next_reads = _awaitable(operations.get_next_reads)
+get_tag_counts = _awaitable(operations.get_tag_counts)
+get_tag_ids = _awaitable(operations.get_tag_ids)
+get_books_by_tags = _awaitable(operations.get_books_by_tags)
+enqueue_job = _awaitable(operations.enqueue_job)
+claim_job = _awaitable(operations.claim_job)
+finish_job = _awaitable(operations.finish_job)
+retry_job = _awaitable(operations.retry_job)
+resolve_duplicate = _awaitable(operations.resolve_duplicate)
+
+
+def shutdown():
+    _executor.shutdown(wait=True)
+    operations.engine.dispose()
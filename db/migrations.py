@@ -0,0 +1,189 @@
+"""Versioned schema migrations.
+
+Migrations are plain functions taking a connection, registered in order with
+@migration(version, description). Applied versions are recorded in
+schema_migrations; run_migrations() applies whatever is missing, each in its
+own transaction. On PostgreSQL an advisory lock keeps concurrently starting
+processes from applying the same migration twice.
+
+    python -m db.migrations           # apply pending migrations
+    python -m db.migrations --status  # list applied and pending versions
+"""
+import argparse
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import text, inspect, select, delete, insert, update, bindparam
+from db.models import Base, Book, ReadingStatus, FinishedRollup, StatusEnum, IngestJob, BookNeighbor
+from db.search import install_search_schema
+
+MIGRATIONS = []
+
+# Arbitrary constant identifying this app's migration lock
+_ADVISORY_LOCK_KEY = 72_605_113
+
+
+def migration(version, description):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+def add_column(connection, table, name, ddl):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists."""
+    columns = {column['name'] for column in inspect(connection).get_columns(table)}
+    if name not in columns:
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
+
+@migration(1, "baseline tables")
+def _baseline(connection):
+    Base.metadata.create_all(connection)
+
+
+@migration(2, "full-text search indexes")
+def _search(connection):
+    install_search_schema(connection)
+
+
+@migration(3, "browse/status indexes and unique reading status per user")
+def _indexes(connection):
+    # Keep the newest row for each (book, user) before enforcing uniqueness
+    connection.execute(text(
+        "DELETE FROM reading_status WHERE id NOT IN "
+        "(SELECT max(id) FROM reading_status GROUP BY book_id, user_id)"
+    ))
+    for statement in [
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_reading_status_book_user ON reading_status (book_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS ix_reading_status_user_status ON reading_status (user_id, status, book_id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_added ON books (added_date, id)",
+        "CREATE INDEX IF NOT EXISTS ix_books_category_added ON books (category, added_date, id)",
+    ]:
+        connection.execute(text(statement))
+
+
+@migration(4, "backfill finished_rollup from reading_status")
+def _backfill_finished_rollup(connection):
+    rows = connection.execute(
+        select(ReadingStatus.user_id, ReadingStatus.finished_date).where(
+            ReadingStatus.status == StatusEnum.finished,
+            ReadingStatus.finished_date.isnot(None)
+        )
+    )
+    counts = Counter((user_id, finished_date.strftime('%Y-%m')) for user_id, finished_date in rows)
+    connection.execute(delete(FinishedRollup))
+    if counts:
+        connection.execute(insert(FinishedRollup), [
+            {'user_id': user_id, 'month': month, 'count': count}
+            for (user_id, month), count in counts.items()
+        ])
+
+
+@migration(5, "duplicate detection keys on books")
+def _duplicate_keys(connection):
+    from services.metadata import dedupe_key
+
+    add_column(connection, 'books', 'norm_key', 'VARCHAR')
+    add_column(connection, 'books', 'content_hash', 'VARCHAR(64)')
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_books_norm_key_size ON books (norm_key, file_size)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_books_content_hash ON books (content_hash)"))
+    # Existing rows have no filename or file on hand; key them by stored title/author
+    rows = connection.execute(select(Book.id, Book.title, Book.author).where(Book.norm_key.is_(None))).all()
+    if rows:
+        connection.execute(
+            update(Book.__table__).where(Book.__table__.c.id == bindparam('book_id')).values(norm_key=bindparam('key')),
+            [{'book_id': book_id, 'key': dedupe_key(title, author)} for book_id, title, author in rows]
+        )
+
+
+@migration(6, "ingest job queue")
+def _ingest_jobs(connection):
+    IngestJob.__table__.create(connection, checkfirst=True)
+
+
+@migration(7, "book similarity graph")
+def _book_neighbors(connection):
+    BookNeighbor.__table__.create(connection, checkfirst=True)
+
+
+@migration(8, "unique book tags and tag lookup index")
+def _book_tag_indexes(connection):
+    connection.execute(text(
+        "DELETE FROM book_tags WHERE id NOT IN "
+        "(SELECT min(id) FROM book_tags GROUP BY book_id, tag_id)"
+    ))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_book_tags_book_tag ON book_tags (book_id, tag_id)"
+    ))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_book_tags_tag_book ON book_tags (tag_id, book_id)"))
+
+
+
+@migration(9, "64-bit Telegram user ids in reading_status and finished_rollup")
+def _bigint_user_ids(connection):
+    # SQLite integers are already 64-bit
+    if connection.dialect.name != 'postgresql':
+        return
+    for table in ('reading_status', 'finished_rollup'):
+        connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN user_id TYPE BIGINT"))
+
+
+
+@migration(10, "category/id index for random picks within a category")
+def _category_id_index(connection):
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_books_category_id ON books (category, id)"))
+
+
+def _ensure_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, description VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _applied(connection):
+    return {row[0] for row in connection.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def run_migrations(engine):
+    """Apply pending migrations in version order. Returns the versions applied."""
+    with engine.begin() as connection:
+        _ensure_table(connection)
+    done = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda item: item[0]):
+        with engine.begin() as connection:
+            if connection.dialect.name == 'postgresql':
+                connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': _ADVISORY_LOCK_KEY})
+            if version in _applied(connection):
+                continue
+            func(connection)
+            connection.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {'v': version, 'd': description, 't': datetime.utcnow()}
+            )
+        print(f"Applied migration {version}: {description}", flush=True)
+        done.append(version)
+    return done
+
+
+def main():
+    from db.operations import engine
+
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument('--status', action='store_true', help="list migrations without applying them")
+    args = parser.parse_args()
+
+    if args.status:
+        with engine.begin() as connection:
+            _ensure_table(connection)
+            applied = _applied(connection)
+        for version, description, _ in sorted(MIGRATIONS, key=lambda item: item[0]):
+            print(f"{'applied' if version in applied else 'pending'}  {version:>3}  {description}")
+        return
+
+    if not run_migrations(engine):
+        print("Schema is up to date", flush=True)
+
+
+if __name__ == '__main__':
+    main()
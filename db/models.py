@@ -1,4 +1,7 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, Enum, ForeignKey
+from sqlalchemy import (
+    create_engine, Column, Integer, BigInteger, SmallInteger, String, Text, Boolean, DateTime, Float, Enum,
+    ForeignKey, LargeBinary, Index
+)
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 import enum
@@ -26,6 +29,40 @@ class Book(Base):
     category = Column(String)
     confidence = Column(Float)
     added_date = Column(DateTime, default=datetime.utcnow)
+    # Duplicate detection: normalized "title author" from the filename, and file SHA-256
+    norm_key = Column(String)
+    content_hash = Column(String(64))
+
+    __table_args__ = (
+        # Keyset pagination, optionally within a category
+        Index('ix_books_added', 'added_date', 'id'),
+        Index('ix_books_category_added', 'category', 'added_date', 'id'),
+        # min/max(id) within a category for random picks
+        Index('ix_books_category_id', 'category', 'id'),
+        Index('ix_books_norm_key_size', 'norm_key', 'file_size'),
+        Index('ix_books_content_hash', 'content_hash'),
+    )
+
+
+class BookEmbedding(Base):
+    __tablename__ = 'book_embeddings'
+
+    book_id = Column(Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    # sha1 of the normalized "title author" text the vector was computed from
+    text_hash = Column(String(40), nullable=False, index=True)
+    model = Column(String, nullable=False)
+    # Little-endian float32, L2-normalized
+    vector = Column(LargeBinary, nullable=False)
+
+
+class BookNeighbor(Base):
+    """The k most similar books to each book by embedding, rank 0 closest."""
+    __tablename__ = 'book_neighbors'
+
+    book_id = Column(Integer, ForeignKey('books.id', ondelete='CASCADE'), primary_key=True)
+    rank = Column(SmallInteger, primary_key=True)
+    neighbor_id = Column(Integer, ForeignKey('books.id', ondelete='CASCADE'), nullable=False)
+    score = Column(Float, nullable=False)
 
 
 class ReadingStatus(Base):
@@ -33,11 +70,58 @@ class ReadingStatus(Base):
 
     id = Column(Integer, primary_key=True)
     book_id = Column(Integer, ForeignKey('books.id'), nullable=False)
-    user_id = Column(Integer, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
     status = Column(Enum(StatusEnum))
     started_date = Column(DateTime)
     finished_date = Column(DateTime)
 
+    __table_args__ = (
+        # Upsert target for update_status
+        Index('uq_reading_status_book_user', 'book_id', 'user_id', unique=True),
+        Index('ix_reading_status_user_status', 'user_id', 'status', 'book_id'),
+    )
+
+
+class FinishedRollup(Base):
+    """Books finished per user per calendar month, maintained by update_status."""
+    __tablename__ = 'finished_rollup'
+
+    user_id = Column(BigInteger, primary_key=True)
+    month = Column(String(7), primary_key=True)  # YYYY-MM
+    count = Column(Integer, nullable=False, default=0)
+
+
+class IngestJob(Base):
+    """A forwarded book waiting for (or being processed by) an ingest worker."""
+    __tablename__ = 'ingest_jobs'
+
+    id = Column(Integer, primary_key=True)
+    # queued, running, done, duplicate (waiting for the user), merged, failed
+    state = Column(String(16), nullable=False, default='queued')
+    chat_id = Column(BigInteger, nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    status_message_id = Column(Integer, nullable=False)
+    file_id = Column(String, nullable=False)
+    file_unique_id = Column(String, nullable=False)
+    file_name = Column(String, nullable=False)
+    file_size = Column(Integer)
+    norm_key = Column(String)
+    # The user chose "Keep both" after a duplicate warning
+    keep = Column(Boolean, nullable=False, default=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Not claimable before this: retry backoff for queued jobs, lease expiry for running ones
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    worker = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    book_id = Column(Integer, ForeignKey('books.id', ondelete='SET NULL'))
+    duplicate_of = Column(Integer, ForeignKey('books.id', ondelete='SET NULL'))
+    error = Column(Text)
+
+    __table_args__ = (
+        Index('ix_ingest_jobs_claim', 'state', 'available_at', 'id'),
+    )
+
 
 class Tag(Base):
     __tablename__ = 'tags'
@@ -52,3 +136,9 @@ class BookTag(Base):
     id = Column(Integer, primary_key=True)
     book_id = Column(Integer, ForeignKey('books.id'))
     tag_id = Column(Integer, ForeignKey('tags.id'))
+
+    __table_args__ = (
+        # Upsert target and a book's tags; the second serves tag -> books filters
+        Index('uq_book_tags_book_tag', 'book_id', 'tag_id', unique=True),
+        Index('ix_book_tags_tag_book', 'tag_id', 'book_id'),
+    )
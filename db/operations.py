@@ -1,145 +1,746 @@
-from sqlalchemy import create_engine, or_
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+from itertools import groupby
+import random
+import time
+import numpy as np
+from sqlalchemy import create_engine, update, select, delete, insert, text, tuple_, and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.sql.expression import func
-from db.models import Base, Book, ReadingStatus, StatusEnum
-from config import DATABASE_URL
-from datetime import datetime
+from db.models import (
+    Book, BookEmbedding, BookNeighbor, BookTag, FinishedRollup, IngestJob, ReadingStatus, StatusEnum, Tag
+)
+from db.search import search
+from db.migrations import run_migrations
+from config import DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, NEIGHBOR_COUNT
+from datetime import datetime, timedelta
 
-engine = create_engine(DATABASE_URL)
-Base.metadata.create_all(engine)
-Session = sessionmaker(bind=engine)
+# Rejection sampling for get_random_book: ids tested per query, queries tried
+RANDOM_CANDIDATES = 32
+RANDOM_ATTEMPTS = 4
 
+# Library-wide counts are shared by every user's Stats, so cache them briefly
+LIBRARY_COUNTS_TTL = 60
+_library_counts = None  # (expires_at, {category: count})
+_tag_counts = None  # (expires_at, [(tag_id, name, count), ...])
 
-def save_book(title, author, file_id, file_unique_id, format, page_count, file_size, category, confidence):
-    session = Session()
-    book = Book(
-        title=title,
-        author=author,
-        file_id=file_id,
-        file_unique_id=file_unique_id,
-        format=format,
-        page_count=page_count,
-        file_size=file_size,
-        category=category,
-        confidence=confidence
-    )
-    session.add(book)
-    session.commit()
-    book_id = book.id
-    session.close()
-    return book_id
+# Keyset pagination over (added_date, id), newest first
+PAGE_SIZE = 10
+_EPOCH = datetime(1970, 1, 1)
+
+# prev_cursor/next_cursor are None when there is no page in that direction;
+# total is only counted for the first page
+Page = namedtuple('Page', ['books', 'total', 'prev_cursor', 'next_cursor'])
+
+Stats = namedtuple('Stats', ['total', 'reading', 'finished', 'queue', 'by_category', 'finished_by_month'])
+
+
+def _engine_options(url):
+    if url.startswith('sqlite'):
+        # SQLite connections are handed between executor threads
+        return {'connect_args': {'check_same_thread': False}}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': True,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+Session = sessionmaker(bind=engine, expire_on_commit=False)
 
 
-def search_books(query):
+def init_db():
+    """Bring the schema up to date. Called once at startup, not on import."""
+    run_migrations(engine)
+
+
+@contextmanager
+def session_scope():
+    """One unit of work: commit on success, roll back on error, always close."""
     session = Session()
-    books = session.query(Book).filter(
-        or_(
-            Book.title.ilike(f'%{query}%'),
-            Book.author.ilike(f'%{query}%')
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _vector_bytes(embedding):
+    return np.asarray(embedding, dtype='<f4').tobytes()
+
+
+def save_book(title, author, file_id, file_unique_id, format, page_count, file_size, category, confidence,
+              embedding=None, text_hash=None, model=None, norm_key=None, content_hash=None, neighbors=None,
+              tags=None):
+    """Insert a book; `neighbors` are its [(book_id, score), ...] most similar books, best first."""
+    with session_scope() as session:
+        book = Book(
+            title=title,
+            author=author,
+            file_id=file_id,
+            file_unique_id=file_unique_id,
+            format=format,
+            page_count=page_count,
+            file_size=file_size,
+            category=category,
+            confidence=confidence,
+            norm_key=norm_key,
+            content_hash=content_hash
         )
-    ).limit(10).all()
-    session.close()
-    return books
+        session.add(book)
+        session.flush()
+        if embedding is not None:
+            session.add(BookEmbedding(
+                book_id=book.id,
+                text_hash=text_hash,
+                model=model,
+                vector=_vector_bytes(embedding)
+            ))
+        if neighbors:
+            _link_neighbors(session, book.id, neighbors)
+        if tags:
+            _tag_books(session, {book.id: tags})
+        book_id = book.id
+    # After commit, so a concurrent Stats request can't re-cache the old counts
+    invalidate_library_counts()
+    return book_id
 
 
-def get_book(book_id):
-    session = Session()
-    book = session.query(Book).filter(Book.id == book_id).first()
-    session.close()
-    return book
+def _neighbor_rows(book_id, neighbors):
+    return [
+        {'book_id': book_id, 'rank': rank, 'neighbor_id': int(neighbor_id), 'score': float(score)}
+        for rank, (neighbor_id, score) in enumerate(neighbors)
+    ]
 
 
-def get_books_by_category(category):
-    session = Session()
-    books = session.query(Book).filter(Book.category == category).all()
-    session.close()
-    return books
+def _link_neighbors(session, book_id, neighbors):
+    """Store a new book's neighbor list and add it to the lists of neighbors it now ranks in."""
+    neighbors = [(int(n), float(score)) for n, score in neighbors if int(n) != book_id][:NEIGHBOR_COUNT]
+    if not neighbors:
+        return
+    session.execute(insert(BookNeighbor), _neighbor_rows(book_id, neighbors))
 
+    lists = defaultdict(list)
+    for row in session.query(BookNeighbor.book_id, BookNeighbor.neighbor_id, BookNeighbor.score).filter(
+        BookNeighbor.book_id.in_([n for n, _ in neighbors])
+    ):
+        lists[row.book_id].append((row.neighbor_id, row.score))
+    rows, changed = [], []
+    for neighbor_id, score in neighbors:
+        current = lists[neighbor_id]
+        if len(current) < NEIGHBOR_COUNT or score > min(s for _, s in current):
+            merged = sorted(current + [(book_id, score)], key=lambda item: -item[1])[:NEIGHBOR_COUNT]
+            rows.extend(_neighbor_rows(neighbor_id, merged))
+            changed.append(neighbor_id)
+    if not changed:
+        return
+    try:
+        # Another process may be rewriting the same lists; theirs wins and
+        # the next neighbors rebuild restores this link
+        with session.begin_nested():
+            session.execute(delete(BookNeighbor).where(BookNeighbor.book_id.in_(changed)))
+            session.execute(insert(BookNeighbor), rows)
+    except IntegrityError:
+        pass
 
-def get_random_book():
-    session = Session()
-    book = session.query(Book).order_by(func.random()).first()
-    session.close()
-    return book
 
+def replace_neighbors(graph):
+    """Overwrite the neighbor lists of the books in `graph` ({book_id: [(book_id, score), ...]})."""
+    with session_scope() as session:
+        session.execute(delete(BookNeighbor).where(BookNeighbor.book_id.in_(list(graph))))
+        rows = [row for book_id, neighbors in graph.items() for row in _neighbor_rows(book_id, neighbors)]
+        if rows:
+            session.execute(insert(BookNeighbor), rows)
 
-def get_reading_queue(user_id):
-    session = Session()
-    books = session.query(Book).join(ReadingStatus).filter(
-        ReadingStatus.user_id == user_id,
-        ReadingStatus.status == StatusEnum.want_to_read
-    ).all()
-    session.close()
-    return books
 
+def get_similar_books(book_id, limit=5):
+    """Most similar books first, read from the precomputed neighbor lists."""
+    with session_scope() as session:
+        return session.query(Book).join(BookNeighbor, BookNeighbor.neighbor_id == Book.id).filter(
+            BookNeighbor.book_id == book_id
+        ).order_by(BookNeighbor.rank).limit(limit).all()
 
-def get_currently_reading(user_id):
-    session = Session()
-    books = session.query(Book).join(ReadingStatus).filter(
-        ReadingStatus.user_id == user_id,
-        ReadingStatus.status == StatusEnum.reading
-    ).all()
-    session.close()
-    return books
 
+def get_next_reads(book_id, user_id, limit=3):
+    """Neighbors of `book_id` the user has not started or finished."""
+    with session_scope() as session:
+        return session.query(Book).join(BookNeighbor, BookNeighbor.neighbor_id == Book.id).outerjoin(
+            ReadingStatus, and_(ReadingStatus.book_id == Book.id, ReadingStatus.user_id == user_id)
+        ).filter(
+            BookNeighbor.book_id == book_id,
+            or_(ReadingStatus.status.is_(None), ReadingStatus.status == StatusEnum.want_to_read)
+        ).order_by(BookNeighbor.rank).limit(limit).all()
 
-def update_status(book_id, user_id, status):
-    session = Session()
-    rs = session.query(ReadingStatus).filter(
-        ReadingStatus.book_id == book_id,
-        ReadingStatus.user_id == user_id
-    ).first()
 
-    if rs:
-        rs.status = status
-        if status == StatusEnum.reading:
-            rs.started_date = datetime.utcnow()
-        elif status == StatusEnum.finished:
-            rs.finished_date = datetime.utcnow()
+def _dialect_insert(session):
+    """INSERT construct with ON CONFLICT support for the session's backend."""
+    return postgresql_insert if session.get_bind().dialect.name == 'postgresql' else sqlite_insert
+
+
+_BOOK_FIELDS = (
+    'title', 'author', 'file_id', 'file_unique_id', 'format',
+    'page_count', 'file_size', 'category', 'confidence', 'norm_key', 'content_hash'
+)
+
+
+def save_books(books, model=None):
+    """Insert many books at once, skipping any already stored.
+
+    `books` are dicts with the save_book fields (norm_key and content_hash
+    included) plus optional 'embedding', 'text_hash' and 'tags'. Rows go out as
+    batched multi-row INSERT ... ON CONFLICT DO NOTHING statements, so a
+    file_id or file_unique_id that is already in the library is skipped
+    rather than failing the batch. Returns
+    {file_unique_id: book_id} for the rows actually inserted.
+    """
+    if not books:
+        return {}
+    with session_scope() as session:
+        insert = _dialect_insert(session)
+        inserted = session.execute(
+            insert(Book).on_conflict_do_nothing().returning(Book.id, Book.file_unique_id),
+            [{field: book[field] for field in _BOOK_FIELDS} for book in books]
+        ).all()
+        ids = {file_unique_id: book_id for book_id, file_unique_id in inserted}
+        embeddings = [
+            {
+                'book_id': ids[book['file_unique_id']],
+                'text_hash': book['text_hash'],
+                'model': model,
+                'vector': _vector_bytes(book['embedding']),
+            }
+            for book in books
+            if book.get('embedding') is not None and book['file_unique_id'] in ids
+        ]
+        if embeddings:
+            session.execute(insert(BookEmbedding).on_conflict_do_nothing(), embeddings)
+        _tag_books(session, {
+            ids[book['file_unique_id']]: book['tags']
+            for book in books
+            if book.get('tags') and book['file_unique_id'] in ids
+        })
+    invalidate_library_counts()
+    return ids
+
+
+def search_books(query, limit=10, offset=0):
+    with session_scope() as session:
+        return search(session, query, limit=limit, offset=offset)
+
+
+def get_book(book_id):
+    with session_scope() as session:
+        return session.query(Book).filter(Book.id == book_id).first()
+
+
+def get_books(book_ids):
+    """Fetch books by primary key, in the order of `book_ids`."""
+    with session_scope() as session:
+        books = {book.id: book for book in session.query(Book).filter(Book.id.in_(book_ids))}
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+def encode_cursor(book):
+    """Compact, underscore-free cursor for callback data: hex microseconds and id."""
+    micros = (book.added_date - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros:x}.{book.id:x}"
+
+
+def decode_cursor(cursor):
+    micros, book_id = cursor.split('.')
+    return _EPOCH + timedelta(microseconds=int(micros, 16)), int(book_id, 16)
+
+
+def _keyset_page(query, cursor, direction, limit):
+    """One page of `query` plus a count on the first page, without reading other pages."""
+    total = query.order_by(None).count() if cursor is None else None
+    key = tuple_(Book.added_date, Book.id)
+    if cursor is None:
+        rows = query.order_by(Book.added_date.desc(), Book.id.desc()).limit(limit + 1).all()
+        has_prev, has_next = False, len(rows) > limit
+    elif direction == 'prev':
+        rows = query.filter(key > decode_cursor(cursor)).order_by(
+            Book.added_date.asc(), Book.id.asc()
+        ).limit(limit + 1).all()
+        has_prev, has_next = len(rows) > limit, True
+        rows = rows[:limit][::-1]
     else:
-        rs = ReadingStatus(
-            book_id=book_id,
-            user_id=user_id,
-            status=status,
-            started_date=datetime.utcnow() if status == StatusEnum.reading else None,
-            finished_date=datetime.utcnow() if status == StatusEnum.finished else None
+        rows = query.filter(key < decode_cursor(cursor)).order_by(
+            Book.added_date.desc(), Book.id.desc()
+        ).limit(limit + 1).all()
+        has_prev, has_next = True, len(rows) > limit
+    books = rows[:limit]
+    if not books:
+        return Page(books, total, None, None)
+    return Page(
+        books,
+        total,
+        encode_cursor(books[0]) if has_prev else None,
+        encode_cursor(books[-1]) if has_next else None
+    )
+
+
+def get_books_by_category(category, cursor=None, direction='next', limit=PAGE_SIZE):
+    with session_scope() as session:
+        return _keyset_page(
+            session.query(Book).filter(Book.category == category), cursor, direction, limit
         )
-        session.add(rs)
 
-    session.commit()
-    session.close()
+
+def _sample_by_id(query):
+    """Uniform random row of `query` without sorting or counting the table.
+
+    Candidate ids are drawn uniformly from the query's id range and checked
+    in one indexed IN lookup per attempt. The first drawn candidate that
+    exists is a uniform pick among the matching rows, however sparse the ids.
+    Within a category, min/max(id) come from ix_books_category_id.
+    """
+    low, high = query.with_entities(func.min(Book.id), func.max(Book.id)).one()
+    if low is None:
+        return None
+    for _ in range(RANDOM_ATTEMPTS):
+        candidates = [random.randint(low, high) for _ in range(RANDOM_CANDIDATES)]
+        found = {book.id: book for book in query.filter(Book.id.in_(set(candidates)))}
+        for candidate in candidates:
+            if candidate in found:
+                return found[candidate]
+    # Ids too sparse for rejection sampling; fall back to an offset pick
+    return _sample_by_offset(query)
+
+
+def _sample_by_offset(query):
+    count = query.count()
+    if not count:
+        return None
+    return query.order_by(Book.id).offset(random.randrange(count)).first()
+
+
+def get_random_book(category=None, user_id=None):
+    """Random book, optionally limited to a category or to the user's reading queue."""
+    with session_scope() as session:
+        query = session.query(Book)
+        if user_id is not None:
+            # A reading queue is small, so an offset into it stays cheap
+            return _sample_by_offset(query.join(ReadingStatus).filter(
+                ReadingStatus.user_id == user_id,
+                ReadingStatus.status == StatusEnum.want_to_read
+            ))
+        if category is not None:
+            query = query.filter(Book.category == category)
+        return _sample_by_id(query)
+
+
+def _books_with_status(user_id, status, cursor, direction, limit):
+    with session_scope() as session:
+        query = session.query(Book).join(ReadingStatus).filter(
+            ReadingStatus.user_id == user_id,
+            ReadingStatus.status == status
+        )
+        return _keyset_page(query, cursor, direction, limit)
+
+
+def get_reading_queue(user_id, cursor=None, direction='next', limit=PAGE_SIZE):
+    return _books_with_status(user_id, StatusEnum.want_to_read, cursor, direction, limit)
+
+
+def get_currently_reading(user_id, cursor=None, direction='next', limit=PAGE_SIZE):
+    return _books_with_status(user_id, StatusEnum.reading, cursor, direction, limit)
+
+
+def _month(date):
+    return date.strftime('%Y-%m')
+
+
+# Columns a book caption needs, returned by the single-statement writes
+_CARD_COLUMNS = (Book.id, Book.title, Book.author, Book.category, Book.file_id)
+
+# One round trip on PostgreSQL: read the previous status, upsert the new one,
+# move the finished count between months and return the caption fields. All
+# CTEs see the same snapshot, so `prev` is the row as it was before the upsert.
+_POSTGRES_UPDATE_STATUS = text("""
+    WITH prev AS (
+        SELECT status, finished_date FROM reading_status
+        WHERE book_id = :book_id AND user_id = :user_id
+    ),
+    upsert AS (
+        INSERT INTO reading_status (book_id, user_id, status, started_date, finished_date)
+        VALUES (:book_id, :user_id, CAST(:status AS statusenum), :started, :finished)
+        ON CONFLICT (book_id, user_id) DO UPDATE SET
+            status = EXCLUDED.status,
+            started_date = COALESCE(EXCLUDED.started_date, reading_status.started_date),
+            finished_date = COALESCE(EXCLUDED.finished_date, reading_status.finished_date)
+        RETURNING book_id
+    ),
+    deltas AS (
+        SELECT to_char(finished_date, 'YYYY-MM') AS month, -1 AS delta FROM prev
+        WHERE status = 'finished' AND finished_date IS NOT NULL
+        UNION ALL
+        SELECT :month, 1 WHERE :status = 'finished'
+    ),
+    rollup AS (
+        INSERT INTO finished_rollup (user_id, month, count)
+        SELECT :user_id, month, sum(delta) FROM deltas GROUP BY month HAVING sum(delta) <> 0
+        ON CONFLICT (user_id, month) DO UPDATE SET count = finished_rollup.count + EXCLUDED.count
+    )
+    SELECT books.id, books.title, books.author, books.category, books.file_id
+    FROM books JOIN upsert ON upsert.book_id = books.id
+""")
+
+
+def _update_status_sqlite(session, book_id, user_id, status, now):
+    prev = session.execute(
+        select(ReadingStatus.status, ReadingStatus.finished_date).where(
+            ReadingStatus.book_id == book_id,
+            ReadingStatus.user_id == user_id
+        )
+    ).first()
+
+    stmt = sqlite_insert(ReadingStatus).values(
+        book_id=book_id,
+        user_id=user_id,
+        status=status,
+        started_date=now if status == StatusEnum.reading else None,
+        finished_date=now if status == StatusEnum.finished else None
+    )
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=['book_id', 'user_id'],
+        set_={
+            'status': stmt.excluded.status,
+            'started_date': func.coalesce(stmt.excluded.started_date, ReadingStatus.started_date),
+            'finished_date': func.coalesce(stmt.excluded.finished_date, ReadingStatus.finished_date),
+        }
+    ))
+
+    deltas = Counter()
+    if prev and prev.status == StatusEnum.finished and prev.finished_date is not None:
+        deltas[_month(prev.finished_date)] -= 1
+    if status == StatusEnum.finished:
+        deltas[_month(now)] += 1
+    for month, delta in deltas.items():
+        if not delta:
+            continue
+        rollup = sqlite_insert(FinishedRollup).values(user_id=user_id, month=month, count=delta)
+        session.execute(rollup.on_conflict_do_update(
+            index_elements=['user_id', 'month'],
+            set_={'count': FinishedRollup.count + rollup.excluded.count}
+        ))
+
+    return session.execute(select(*_CARD_COLUMNS).where(Book.id == book_id)).first()
+
+
+def update_status(book_id, user_id, status):
+    """Set a user's status for a book and return the book's caption fields."""
+    now = datetime.utcnow()
+    with session_scope() as session:
+        if session.get_bind().dialect.name == 'postgresql':
+            return session.execute(_POSTGRES_UPDATE_STATUS, {
+                'book_id': book_id,
+                'user_id': user_id,
+                'status': status.name,
+                'started': now if status == StatusEnum.reading else None,
+                'finished': now if status == StatusEnum.finished else None,
+                'month': _month(now),
+            }).first()
+        return _update_status_sqlite(session, book_id, user_id, status, now)
 
 
 def update_book_category(book_id, category):
-    session = Session()
-    book = session.query(Book).filter(Book.id == book_id).first()
-    if book:
-        book.category = category
-        session.commit()
-    session.close()
+    """Change a book's category and return its caption fields (None if missing)."""
+    with session_scope() as session:
+        book = session.execute(
+            update(Book).where(Book.id == book_id).values(category=category).returning(*_CARD_COLUMNS)
+        ).first()
+    invalidate_library_counts()
+    return book
 
 
-def get_stats(user_id):
-    session = Session()
-    total = session.query(Book).count()
-    reading = session.query(ReadingStatus).filter(
-        ReadingStatus.user_id == user_id,
-        ReadingStatus.status == StatusEnum.reading
-    ).count()
-    finished = session.query(ReadingStatus).filter(
-        ReadingStatus.user_id == user_id,
-        ReadingStatus.status == StatusEnum.finished
-    ).count()
-    queue = session.query(ReadingStatus).filter(
-        ReadingStatus.user_id == user_id,
-        ReadingStatus.status == StatusEnum.want_to_read
-    ).count()
-    session.close()
-    return total, reading, finished, queue
+def invalidate_library_counts():
+    global _library_counts, _tag_counts
+    _library_counts = None
+    _tag_counts = None
+
+
+def _category_counts(session):
+    global _library_counts
+    cached = _library_counts
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    counts = dict(session.query(Book.category, func.count(Book.id)).group_by(Book.category).all())
+    _library_counts = (time.monotonic() + LIBRARY_COUNTS_TTL, counts)
+    return counts
+
+
+def get_stats(user_id, months=6):
+    with session_scope() as session:
+        by_status = dict(session.query(ReadingStatus.status, func.count(ReadingStatus.id)).filter(
+            ReadingStatus.user_id == user_id
+        ).group_by(ReadingStatus.status).all())
+        by_category = _category_counts(session)
+        finished_by_month = session.query(FinishedRollup.month, FinishedRollup.count).filter(
+            FinishedRollup.user_id == user_id,
+            FinishedRollup.count > 0
+        ).order_by(FinishedRollup.month.desc()).limit(months).all()
+        return Stats(
+            total=sum(by_category.values()),
+            reading=by_status.get(StatusEnum.reading, 0),
+            finished=by_status.get(StatusEnum.finished, 0),
+            queue=by_status.get(StatusEnum.want_to_read, 0),
+            by_category=by_category,
+            finished_by_month=[(month, count) for month, count in finished_by_month]
+        )
 
 
 def book_exists(file_unique_id):
-    session = Session()
-    exists = session.query(Book).filter(Book.file_unique_id == file_unique_id).first() is not None
-    session.close()
-    return exists
+    with session_scope() as session:
+        return session.query(Book).filter(Book.file_unique_id == file_unique_id).first() is not None
+
+
+def find_duplicates(file_size, norm_key, limit=3):
+    """Books with the same size and normalized filename key, checked before download."""
+    with session_scope() as session:
+        return session.query(Book).filter(
+            Book.norm_key == norm_key,
+            Book.file_size == file_size
+        ).limit(limit).all()
+
+
+def find_by_content_hash(content_hash, limit=3):
+    with session_scope() as session:
+        return session.query(Book).filter(Book.content_hash == content_hash).limit(limit).all()
+
+
+def find_content_hashes(content_hashes):
+    """The subset of `content_hashes` already in the library."""
+    with session_scope() as session:
+        return {
+            row[0] for row in session.query(Book.content_hash).filter(
+                Book.content_hash.in_(set(content_hashes))
+            )
+        }
+
+
+def duplicate_groups(min_size=2):
+    """[(reason, [book_id, ...]), ...] for books sharing (norm_key, file_size) or content_hash."""
+    groups = []
+    with session_scope() as session:
+        for reason, columns in (
+            ('same name and size', (Book.norm_key, Book.file_size)),
+            ('identical file', (Book.content_hash,)),
+        ):
+            shared = session.query(*columns).filter(
+                *(column.isnot(None) for column in columns)
+            ).group_by(*columns).having(func.count(Book.id) >= min_size).subquery()
+            rows = session.query(Book.id, *columns).join(
+                shared, and_(*(column == shared.c[column.key] for column in columns))
+            ).order_by(*columns, Book.id)
+            for _, members in groupby(rows, key=lambda row: tuple(row[1:])):
+                groups.append((reason, [row[0] for row in members]))
+    return groups
+
+
+def save_embeddings(rows, model):
+    """Store (or replace) embeddings for existing books; rows are (book_id, text_hash, embedding)."""
+    with session_scope() as session:
+        for book_id, text_hash, embedding in rows:
+            session.merge(
+                BookEmbedding(book_id=book_id, text_hash=text_hash, model=model, vector=_vector_bytes(embedding))
+            )
+
+
+def find_embeddings(text_hashes, model):
+    """{text_hash: vector} for stored `model` embeddings of any of `text_hashes`."""
+    if not text_hashes:
+        return {}
+    with session_scope() as session:
+        rows = session.query(BookEmbedding.text_hash, BookEmbedding.vector).filter(
+            BookEmbedding.text_hash.in_(set(text_hashes)), BookEmbedding.model == model
+        ).all()
+    return {row.text_hash: np.frombuffer(row.vector, dtype='<f4') for row in rows}
+
+
+def get_books_without_embeddings(limit, model=None):
+    """Books with no stored embedding, or (given `model`) one computed by a different model."""
+    missing = BookEmbedding.book_id.is_(None)
+    if model is not None:
+        missing = missing | (BookEmbedding.model != model)
+    with session_scope() as session:
+        return session.query(Book.id, Book.title, Book.author).outerjoin(
+            BookEmbedding, BookEmbedding.book_id == Book.id
+        ).filter(missing).order_by(Book.id).limit(limit).all()
+
+
+def iter_embedding_chunks(chunk_size=10000, after_id=0, model=None):
+    """Yield (book_ids, matrix) chunks of stored embeddings with book id > after_id, in id order.
+
+    Given `model`, vectors computed by any other model are skipped.
+    """
+    last_id = after_id
+    while True:
+        with session_scope() as session:
+            query = session.query(BookEmbedding.book_id, BookEmbedding.vector).filter(
+                BookEmbedding.book_id > last_id
+            )
+            if model is not None:
+                query = query.filter(BookEmbedding.model == model)
+            rows = query.order_by(BookEmbedding.book_id).limit(chunk_size).all()
+        if not rows:
+            return
+        ids = np.fromiter((row.book_id for row in rows), dtype=np.int64, count=len(rows))
+        matrix = np.frombuffer(b''.join(row.vector for row in rows), dtype='<f4').reshape(len(rows), -1)
+        yield ids, matrix
+        last_id = int(ids[-1])
+
+
+def iter_book_titles(chunk_size=10000, after_id=0):
+    """Yield lists of (book_id, title, author) with book id > after_id, in id order."""
+    last_id = after_id
+    while True:
+        with session_scope() as session:
+            rows = session.query(Book.id, Book.title, Book.author).filter(
+                Book.id > last_id
+            ).order_by(Book.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield [tuple(row) for row in rows]
+        last_id = rows[-1][0]
+
+
+def bulk_update_categories(rows):
+    """Reassign categories in one executemany; rows are (book_id, category, confidence)."""
+    with session_scope() as session:
+        session.execute(update(Book), [
+            {'id': book_id, 'category': category, 'confidence': confidence}
+            for book_id, category, confidence in rows
+        ])
+    invalidate_library_counts()
+
+
+def enqueue_job(**fields):
+    """Queue a forwarded book for the ingest workers. Returns the job id."""
+    with session_scope() as session:
+        job = IngestJob(**fields)
+        session.add(job)
+        session.flush()
+        return job.id
+
+
+def claim_job(worker, lease_seconds):
+    """Atomically take the oldest available job, or return None.
+
+    Running jobs whose lease expired (their worker died) are taken over.
+    PostgreSQL skips rows other workers have locked; SQLite serializes
+    writers, so the same single UPDATE is safe there without the lock.
+    """
+    now = datetime.utcnow()
+    candidate = select(IngestJob.id).where(
+        IngestJob.state.in_(('queued', 'running')),
+        IngestJob.available_at <= now
+    ).order_by(IngestJob.id).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    with session_scope() as session:
+        return session.execute(
+            update(IngestJob).where(IngestJob.id == candidate).values(
+                state='running',
+                worker=worker,
+                attempts=IngestJob.attempts + 1,
+                available_at=now + timedelta(seconds=lease_seconds)
+            ).returning(IngestJob)
+        ).scalars().first()
+
+
+def finish_job(job_id, state, book_id=None, duplicate_of=None, error=None):
+    with session_scope() as session:
+        session.execute(update(IngestJob).where(IngestJob.id == job_id).values(
+            state=state, book_id=book_id, duplicate_of=duplicate_of, error=error,
+            finished_at=datetime.utcnow()
+        ))
+
+
+def retry_job(job_id, error, delay_seconds, charge_attempt=True):
+    """Put a claimed job back in the queue after `delay_seconds`."""
+    values = {
+        'state': 'queued',
+        'error': error,
+        'available_at': datetime.utcnow() + timedelta(seconds=delay_seconds),
+    }
+    if not charge_attempt:
+        values['attempts'] = IngestJob.attempts - 1
+    with session_scope() as session:
+        session.execute(update(IngestJob).where(IngestJob.id == job_id).values(**values))
+
+
+def resolve_duplicate(job_id, user_id, keep):
+    """Apply the user's answer to a duplicate warning: requeue with keep set, or mark merged.
+
+    Returns False if the job is not waiting on this user (already answered or not theirs).
+    """
+    values = {'state': 'queued', 'keep': True, 'available_at': datetime.utcnow()} if keep else {'state': 'merged'}
+    with session_scope() as session:
+        return session.execute(update(IngestJob).where(
+            IngestJob.id == job_id,
+            IngestJob.user_id == user_id,
+            IngestJob.state == 'duplicate'
+        ).values(**values).returning(IngestJob.id)).first() is not None
+
+
+def _tag_books(session, book_tags):
+    """Attach tags by name ({book_id: [name, ...]}), creating missing tags; both are batch upserts."""
+    names = {name for tags in book_tags.values() for name in tags}
+    if not names:
+        return
+    insert = _dialect_insert(session)
+    session.execute(insert(Tag).on_conflict_do_nothing(), [{'name': name} for name in names])
+    tag_ids = dict(session.query(Tag.name, Tag.id).filter(Tag.name.in_(names)))
+    session.execute(insert(BookTag).on_conflict_do_nothing(), [
+        {'book_id': book_id, 'tag_id': tag_ids[name]}
+        for book_id, tags in book_tags.items() for name in set(tags)
+    ])
+
+
+def replace_tags(book_tags):
+    """Overwrite the tags of the books in `book_tags` ({book_id: [name, ...]})."""
+    with session_scope() as session:
+        session.execute(delete(BookTag).where(BookTag.book_id.in_(list(book_tags))))
+        _tag_books(session, book_tags)
+    invalidate_library_counts()
+
+
+def get_tag_counts():
+    """[(tag_id, name, book count), ...], most used first; cached like the category counts."""
+    global _tag_counts
+    cached = _tag_counts
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+    with session_scope() as session:
+        counts = [tuple(row) for row in session.query(Tag.id, Tag.name, func.count(BookTag.book_id)).join(
+            BookTag, BookTag.tag_id == Tag.id
+        ).group_by(Tag.id, Tag.name).order_by(func.count(BookTag.book_id).desc(), Tag.name).all()]
+    _tag_counts = (time.monotonic() + LIBRARY_COUNTS_TTL, counts)
+    return counts
+
+
+def get_tag_ids(names):
+    """{name: tag_id} for the names that exist."""
+    with session_scope() as session:
+        return dict(session.query(Tag.name, Tag.id).filter(Tag.name.in_(set(names))))
+
+
+def get_books_by_tags(tag_ids, match_all=True, cursor=None, direction='next', limit=PAGE_SIZE):
+    """Books carrying all (or any) of `tag_ids`, newest first.
+
+    The tag filter is one pass over ix_book_tags_tag_book: book ids of the
+    given tags, grouped and counted when every tag is required.
+    """
+    tag_ids = list(set(tag_ids))
+    matching = select(BookTag.book_id).where(BookTag.tag_id.in_(tag_ids))
+    if match_all and len(tag_ids) > 1:
+        matching = matching.group_by(BookTag.book_id).having(func.count(BookTag.tag_id) == len(tag_ids))
+    with session_scope() as session:
+        return _keyset_page(session.query(Book).filter(Book.id.in_(matching)), cursor, direction, limit)
@@ -0,0 +1,133 @@
+"""Full-text search over book titles and authors.
+
+PostgreSQL uses a generated tsvector column with a GIN index for ranked word
+matches and pg_trgm indexes for typo-tolerant and substring matches. SQLite
+uses an FTS5 table kept in sync with `books` by triggers. Anything else falls
+back to an unindexed ILIKE scan.
+"""
+import re
+from sqlalchemy import text, or_
+from db.models import Book
+
+POSTGRES_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE books ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_books_search_vector ON books USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING GIN (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING GIN (author gin_trgm_ops)",
+]
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        title, author, content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+        INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        INSERT INTO books_fts(rowid, title, author) VALUES (new.id, new.title, new.author);
+    END
+    """,
+]
+
+_BOOK_COLUMNS = ', '.join(f'books.{column.name}' for column in Book.__table__.columns)
+
+POSTGRES_QUERY = f"""
+    SELECT {_BOOK_COLUMNS}
+    FROM books, websearch_to_tsquery('simple', :q) AS query
+    WHERE books.search_vector @@ query
+       OR books.title % :q OR books.author % :q
+       OR books.title ILIKE :pattern OR books.author ILIKE :pattern
+    ORDER BY ts_rank(books.search_vector, query)
+             + greatest(similarity(books.title, :q), similarity(coalesce(books.author, ''), :q)) DESC,
+             books.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+SQLITE_QUERY = f"""
+    SELECT {_BOOK_COLUMNS}
+    FROM books_fts JOIN books ON books.id = books_fts.rowid
+    WHERE books_fts MATCH :q
+    ORDER BY bm25(books_fts, 2.0, 1.0), books.id DESC
+    LIMIT :limit OFFSET :offset
+"""
+
+
+def install_search_schema(connection):
+    """Create search columns, indexes and triggers if the backend supports them."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        for statement in POSTGRES_SCHEMA:
+            connection.execute(text(statement))
+    elif dialect == 'sqlite':
+        created = not _has_fts_table(connection)
+        try:
+            for statement in SQLITE_SCHEMA:
+                connection.execute(text(statement))
+        except Exception as e:
+            # SQLite built without FTS5: search falls back to ILIKE
+            print(f"FTS5 unavailable, using unindexed search: {e}", flush=True)
+            return
+        if created:
+            connection.execute(text("INSERT INTO books_fts(books_fts) VALUES ('rebuild')"))
+
+
+def _has_fts_table(connection):
+    return connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'"
+    )).first() is not None
+
+
+def _escape_like(query):
+    return re.sub(r'([\\%_])', r'\\\1', query)
+
+
+def _fts5_match(query):
+    """Turn free text into an FTS5 expression: every word must match as a prefix."""
+    words = re.findall(r'\w+', query, re.UNICODE)
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search(session, query, limit=10, offset=0):
+    """Return up to `limit` Books matching `query`, best match first."""
+    query = query.strip()
+    if not query:
+        return []
+    dialect = session.get_bind().dialect.name
+    params = {'q': query, 'limit': limit, 'offset': offset}
+
+    if dialect == 'postgresql':
+        params['pattern'] = f'%{_escape_like(query)}%'
+        return session.query(Book).from_statement(text(POSTGRES_QUERY)).params(**params).all()
+
+    if dialect == 'sqlite' and _has_fts_table(session.connection()):
+        params['q'] = _fts5_match(query)
+        if not params['q']:
+            return []
+        return session.query(Book).from_statement(text(SQLITE_QUERY)).params(**params).all()
+
+    pattern = f'%{_escape_like(query)}%'
+    return session.query(Book).filter(
+        or_(
+            Book.title.ilike(pattern, escape='\\'),
+            Book.author.ilike(pattern, escape='\\')
+        )
+    ).order_by(Book.id.desc()).limit(limit).offset(offset).all()
@@ -0,0 +1,72 @@
+"""Read-through cache of book snapshots.
+
+Snapshots are immutable tuples of the fields a book card needs. They are
+populated when a book is saved or read, and replaced when its category
+changes, so repeat views of a hot book never reach the database. Captions
+are rendered from whatever row or snapshot is in hand, which is cheaper
+than any cache lookup and never shows an older category than that row.
+"""
+import asyncio
+from collections import namedtuple
+from services import metrics
+from services.cache import MemoryCache, make_cache
+from db.async_operations import get_book, get_books
+
+BookSnapshot = namedtuple('BookSnapshot', ['id', 'title', 'author', 'category', 'file_id'])
+
+_cache = make_cache(prefix='leibniz:book:')
+metrics.watch_cache('book', _cache)
+
+
+async def _call(method, *args):
+    # A Redis round trip would block the event loop; memory lookups are instant
+    if isinstance(_cache, MemoryCache):
+        return method(*args)
+    return await asyncio.to_thread(method, *args)
+
+
+def caption(book, note=None, with_category=True):
+    caption = f"{book.title}\nby {book.author or 'Unknown'}"
+    if with_category:
+        caption += f"\n[{book.category}]"
+    if note:
+        caption += f"\n\n[{note}]"
+    return caption
+
+
+def snapshot(book):
+    """Snapshot any object or row with id/title/author/category/file_id."""
+    return BookSnapshot(book.id, book.title, book.author, book.category, book.file_id)
+
+
+async def put(book):
+    """Cache (or replace) a book's snapshot."""
+    snap = snapshot(book)
+    await _call(_cache.set, f"{snap.id}", list(snap))
+    return snap
+
+
+def clear():
+    _cache.clear()
+
+
+async def get_book_snapshot(book_id):
+    cached = await _call(_cache.get, f"{book_id}")
+    if cached is not None:
+        return BookSnapshot(*cached)
+    book = await get_book(book_id)
+    return await put(book) if book else None
+
+
+async def get_book_snapshots(book_ids):
+    """Snapshots in the order of `book_ids`: one cache lookup, misses fetched in one query."""
+    cached = await _call(_cache.get_many, [f"{book_id}" for book_id in book_ids])
+    found = {
+        book_id: BookSnapshot(*value) for book_id, value in zip(book_ids, cached) if value is not None
+    }
+    missing = [book_id for book_id in book_ids if book_id not in found]
+    if missing:
+        books = await get_books(missing)
+        await _call(_cache.set_many, {f"{book.id}": list(snapshot(book)) for book in books})
+        found.update((book.id, snapshot(book)) for book in books)
+    return [found[book_id] for book_id in book_ids if book_id in found]
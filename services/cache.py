@@ -0,0 +1,135 @@
+"""Small key-value caches with a common get/set/delete/clear/stats interface.
+
+get_many/set_many batch several keys into one lock or one Redis round trip.
+
+MemoryCache is a size-bounded LRU with a per-entry TTL, private to one
+process. RedisCache stores JSON values in a Redis-compatible server so several
+bot processes share one cache. make_cache() picks one from config.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import CACHE_BACKEND, CACHE_URL, CACHE_MAX_ITEMS, CACHE_TTL
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class MemoryCache:
+    def __init__(self, max_items, ttl):
+        self.max_items = max_items
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._data[key]
+                entry = None
+            self._stats.record(entry is not None)
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value):
+        self.set_many({key: value})
+
+    def set_many(self, items):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl
+            for key, value in items.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats.as_dict(), backend='memory', size=len(self._data), max_items=self.max_items)
+
+
+class RedisCache:
+    """Values must be JSON-serializable; tuples come back as lists."""
+
+    def __init__(self, url, ttl, prefix='leibniz:'):
+        import redis
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._stats = CacheStats()
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        self._stats.record(raw is not None)
+        return None if raw is None else json.loads(raw)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        values = []
+        for raw in self._client.mget([self.prefix + key for key in keys]):
+            self._stats.record(raw is not None)
+            values.append(None if raw is None else json.loads(raw))
+        return values
+
+    def set(self, key, value):
+        self._client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+    def set_many(self, items):
+        if not items:
+            return
+        with self._client.pipeline(transaction=False) as pipe:
+            for key, value in items.items():
+                pipe.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+            pipe.execute()
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self._client.scan_iter(match=self.prefix + '*', count=1000):
+            self._client.delete(key)
+
+    def stats(self):
+        return dict(self._stats.as_dict(), backend='redis')
+
+
+def make_cache(ttl=CACHE_TTL, max_items=CACHE_MAX_ITEMS, prefix='leibniz:'):
+    if CACHE_BACKEND == 'redis':
+        return RedisCache(CACHE_URL, ttl, prefix=prefix)
+    return MemoryCache(max_items, ttl)
@@ -0,0 +1,65 @@
+"""Report likely duplicate books already in the library.
+
+    python -m services.dedupe [--threshold 0.97] [--json]
+
+Groups books sharing a normalized filename key and size, or an identical
+content hash, then finds near-duplicate titles by comparing stored
+embeddings chunk against chunk, so the full similarity matrix is never
+materialized. Nothing is deleted; the report lists book ids to review.
+"""
+import argparse
+import json
+import numpy as np
+from config import DUPLICATE_SIMILARITY
+from db.operations import duplicate_groups, iter_embedding_chunks, get_books
+from services.nlp import MODEL_NAME
+
+CHUNK_SIZE = 4096
+
+
+def similar_pairs(threshold, chunk_size=CHUNK_SIZE):
+    """[(book_id, book_id, score), ...] for stored embeddings at least `threshold` similar."""
+    chunks = list(iter_embedding_chunks(chunk_size, model=MODEL_NAME))
+    pairs = []
+    for i, (left_ids, left) in enumerate(chunks):
+        for right_ids, right in chunks[i:]:
+            scores = left @ right.T
+            rows, columns = np.nonzero(scores >= threshold)
+            for row, column in zip(rows, columns):
+                # Each pair once, and never a book with itself
+                if left_ids[row] < right_ids[column]:
+                    pairs.append((int(left_ids[row]), int(right_ids[column]), float(scores[row, column])))
+    pairs.sort(key=lambda pair: -pair[2])
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report duplicate books")
+    parser.add_argument('--threshold', type=float, default=DUPLICATE_SIMILARITY)
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    groups = duplicate_groups()
+    pairs = similar_pairs(args.threshold)
+
+    if args.json:
+        print(json.dumps({
+            'groups': [{'reason': reason, 'book_ids': ids} for reason, ids in groups],
+            'similar': [{'book_ids': [a, b], 'score': round(score, 4)} for a, b, score in pairs],
+        }, indent=2))
+        return
+
+    titles = {book.id: book.title for book in get_books(list(
+        {book_id for _, ids in groups for book_id in ids} | {book_id for a, b, _ in pairs for book_id in (a, b)}
+    ))}
+    for reason, ids in groups:
+        print(f"{reason}:", flush=True)
+        for book_id in ids:
+            print(f"  #{book_id} {titles.get(book_id, '?')}", flush=True)
+    for a, b, score in pairs:
+        print(f"similar ({score:.0%}): #{a} {titles.get(a, '?')} / #{b} {titles.get(b, '?')}", flush=True)
+    print(f"{len(groups)} duplicate groups, {len(pairs)} similar pairs", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Stream Telegram files to disk instead of buffering them in memory."""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+import httpx
+
+CHUNK_SIZE = 64 * 1024
+
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=httpx.Timeout(30.0, read=60.0))
+    return _client
+
+
+async def _stream_to(url, out):
+    async with _get_client().stream('GET', url) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes(CHUNK_SIZE):
+            out.write(chunk)
+
+
+@asynccontextmanager
+async def downloaded(tg_file, suffix=''):
+    """Download a telegram.File into a temporary file and yield its path.
+
+    The body is written chunk by chunk, so only one chunk is held in memory at
+    a time. The file is removed when the block exits.
+    """
+    fd, path = tempfile.mkstemp(prefix='leibniz-', suffix=suffix)
+    try:
+        if tg_file.file_path and tg_file.file_path.startswith(('http://', 'https://')):
+            with os.fdopen(fd, 'wb') as out:
+                await _stream_to(tg_file.file_path, out)
+        else:
+            # Local Bot API server: file_path is already on this machine
+            os.close(fd)
+            await tg_file.download_to_drive(path)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
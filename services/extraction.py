@@ -0,0 +1,154 @@
+"""Process pool that keeps metadata extraction off the event loop.
+
+Workers are spawned fresh (no forked copy of the bot), recycled after a fixed
+number of jobs, run under an address-space cap and interrupt themselves when a
+file takes too long. Submissions are bounded, so a burst of uploads waits for a
+free slot instead of piling work onto the pool.
+"""
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import (
+    EXTRACT_WORKERS, EXTRACT_TIMEOUT, EXTRACT_MEMORY_MB,
+    EXTRACT_MAX_TASKS_PER_WORKER, EXTRACT_QUEUE_SIZE,
+    SAMPLE_PAGES, SAMPLE_SPINE_ITEMS, SAMPLE_MAX_BYTES, SAMPLE_MAX_CHARS, SAMPLE_SECONDS
+)
+from services.metadata import extract_metadata, extract_text_sample, parse_filename, file_format
+
+
+class ExtractionTimeout(Exception):
+    pass
+
+
+def _init_worker(memory_mb):
+    import resource
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    # Ctrl+C is handled by the bot process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout()
+
+
+def _extract_with_deadline(path, filename, timeout):
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_metadata(path, filename)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _sample_with_deadline(path, filename, seconds):
+    # The sampler checks its own deadline between pages; the alarm catches a
+    # single page that runs long
+    signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, 2 * seconds)
+    try:
+        return extract_text_sample(
+            path, filename, SAMPLE_PAGES, SAMPLE_SPINE_ITEMS, SAMPLE_MAX_BYTES, SAMPLE_MAX_CHARS, seconds
+        )
+    except ExtractionTimeout:
+        return ''
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def filename_metadata(filename):
+    """Metadata guessed from the filename alone, used when extraction fails."""
+    title, author = parse_filename(filename)
+    return title, author, 0, file_format(filename)
+
+
+class ExtractionPool:
+    def __init__(self, workers, timeout, memory_mb, max_tasks_per_worker, queue_size):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._slots = asyncio.Semaphore(queue_size)
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.memory_mb,),
+                max_tasks_per_child=self.max_tasks_per_worker
+            )
+        return self._executor
+
+    def _reset(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # A worker stuck in native code ignores the alarm; kill it outright.
+        # Other in-flight jobs see BrokenProcessPool and fall back as well.
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def extract(self, path, filename):
+        """Extract (title, author, pages, format) from the file at `path`.
+
+        Only the path crosses the process boundary; the worker opens the file
+        itself. Never raises for bad files.
+        """
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                future = loop.run_in_executor(
+                    executor, _extract_with_deadline, path, filename, self.timeout
+                )
+                # The worker interrupts itself at `timeout`; the extra second
+                # only catches workers that could not be interrupted.
+                return await asyncio.wait_for(future, self.timeout + 1)
+            except asyncio.TimeoutError:
+                print(f"Extraction timed out for {filename}", flush=True)
+                if self._executor is executor:
+                    self._reset()
+            except BrokenProcessPool:
+                print(f"Extraction worker crashed on {filename}", flush=True)
+                if self._executor is executor:
+                    self._reset()
+            return filename_metadata(filename)
+
+    async def sample(self, path, filename):
+        """A bounded text sample from the start of the book at `path`, or '' if none."""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            executor = self._get_executor()
+            try:
+                future = loop.run_in_executor(executor, _sample_with_deadline, path, filename, SAMPLE_SECONDS)
+                return await asyncio.wait_for(future, 2 * SAMPLE_SECONDS + 1)
+            except asyncio.TimeoutError:
+                print(f"Text sampling timed out for {filename}", flush=True)
+                if self._executor is executor:
+                    self._reset()
+            except BrokenProcessPool:
+                print(f"Extraction worker crashed sampling {filename}", flush=True)
+                if self._executor is executor:
+                    self._reset()
+            return ''
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+extraction_pool = ExtractionPool(
+    workers=EXTRACT_WORKERS,
+    timeout=EXTRACT_TIMEOUT,
+    memory_mb=EXTRACT_MEMORY_MB,
+    max_tasks_per_worker=EXTRACT_MAX_TASKS_PER_WORKER,
+    queue_size=EXTRACT_QUEUE_SIZE
+)
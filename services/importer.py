@@ -0,0 +1,240 @@
+"""Bulk import books from a directory or a Telegram Desktop export.
+
+    python -m services.importer ~/Books --chat-id -1001234567890
+    python -m services.importer ~/Export/ChatExport/result.json --chat-id -1001234567890
+
+The library stores Telegram file references, so every file is uploaded once
+to --chat-id (a private channel or chat the bot can post to) to obtain one.
+Files are processed in chunks: metadata is extracted in the process pool,
+titles are categorized in one embedding batch, uploads run concurrently
+behind the rate limiter, and rows are inserted with multi-row statements
+that skip files already in the library. Files whose content hash is
+already stored, or that repeat within a chunk, are skipped before upload.
+Finished files are appended to a
+checkpoint after every chunk, so an interrupted import resumes where it
+stopped. --dry-run skips upload and insert to measure the local stages.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from telegram.ext import ExtBot
+from config import BOT_TOKEN, TELEGRAM_BASE_URL, CATEGORIZE_FROM, NLP_TOP_K
+from bot.delivery import TelegramRateLimiter
+from db.operations import init_db, save_books, find_content_hashes, find_embeddings
+from services.extraction import extraction_pool
+from services.metadata import parse_filename, dedupe_key, file_sha256
+from services.nlp import init_model, categorize_many, categorize_reusing, tag_embeddings, text_hash, MODEL_NAME
+
+SUPPORTED = ('.pdf', '.epub', '.mobi', '.azw3', '.fb2')
+
+# Bots may upload files up to 50 MB
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+def scan_directory(root):
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in sorted(names):
+            if name.lower().endswith(SUPPORTED):
+                files.append((os.path.join(directory, name), name))
+    return files
+
+
+def scan_telegram_export(result_json):
+    """Book files referenced by a Telegram Desktop export's result.json."""
+    base = os.path.dirname(os.path.abspath(result_json))
+    with open(result_json, encoding='utf-8') as f:
+        export = json.load(f)
+    files = []
+    for message in export.get('messages', []):
+        relative = message.get('file')
+        # Exports made without media say "(File not included. ...)" here
+        if not relative or relative.startswith('('):
+            continue
+        name = message.get('file_name') or os.path.basename(relative)
+        if name.lower().endswith(SUPPORTED):
+            files.append((os.path.join(base, relative), name))
+    return files
+
+
+def load_checkpoint(path):
+    done = set()
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    done.add(json.loads(line)['path'])
+    return done
+
+
+def append_checkpoint(path, entries):
+    with open(path, 'a', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+async def upload(bot, chat_id, slots, path, filename):
+    """Upload one file and return its Document, or None if it failed."""
+    if os.path.getsize(path) > MAX_UPLOAD_BYTES:
+        print(f"Skipping {filename}: larger than 50 MB", flush=True)
+        return None
+    async with slots:
+        try:
+            with open(path, 'rb') as f:
+                message = await bot.send_document(
+                    chat_id=chat_id, document=f, filename=filename, disable_notification=True
+                )
+            return message.document
+        except Exception as e:
+            print(f"Upload failed for {filename}: {e}", flush=True)
+            return None
+
+
+def hash_chunk(chunk):
+    """content hashes for `chunk`, and the paths of files already in the library or repeated in the chunk."""
+    hashes = [file_sha256(path) for path, _ in chunk]
+    known = find_content_hashes(hashes)
+    duplicates, seen = set(), set()
+    for (path, _), content_hash in zip(chunk, hashes):
+        if content_hash in known or content_hash in seen:
+            duplicates.add(path)
+        seen.add(content_hash)
+    return hashes, duplicates
+
+
+async def import_chunk(bot, chat_id, slots, chunk, dry_run):
+    hashes, duplicates = await asyncio.to_thread(hash_chunk, chunk)
+    # Identical files are skipped before extraction and upload
+    entries = [{'path': path, 'status': 'duplicate', 'book_id': None} for path, _ in chunk if path in duplicates]
+    kept = [(item, content_hash) for item, content_hash in zip(chunk, hashes) if item[0] not in duplicates]
+    if not kept:
+        return entries
+    chunk, hashes = zip(*kept)
+
+    metadata = await asyncio.gather(*(extraction_pool.extract(path, name) for path, name in chunk))
+    books = [(title or name, author) for (_, name), (title, author, _, _) in zip(chunk, metadata)]
+    if CATEGORIZE_FROM == 'content':
+        samples = await asyncio.gather(*(extraction_pool.sample(path, name) for path, name in chunk))
+        results = await asyncio.to_thread(categorize_many, books, NLP_TOP_K, samples)
+    else:
+        # Titles already in the library (a re-import, another edition) reuse their stored vector
+        stored = await asyncio.to_thread(find_embeddings, [text_hash(*book) for book in books], MODEL_NAME)
+        results = await asyncio.to_thread(categorize_reusing, books, stored, NLP_TOP_K)
+    tags = tag_embeddings([result.embedding for result in results], books)
+    if dry_run:
+        return entries + [{'path': path, 'status': 'dry-run'} for path, _ in chunk]
+
+    documents = await asyncio.gather(*(upload(bot, chat_id, slots, path, name) for path, name in chunk))
+    rows = []
+    for (_, name), document, (title, author), (_, _, pages, format), result, content_hash, book_tags in zip(
+        chunk, documents, books, metadata, results, hashes, tags
+    ):
+        if document is None:
+            continue
+        rows.append({
+            'title': title,
+            'author': author,
+            'file_id': document.file_id,
+            'file_unique_id': document.file_unique_id,
+            'format': format,
+            'page_count': pages,
+            'file_size': document.file_size,
+            'category': result.category,
+            'confidence': result.confidence,
+            'embedding': result.embedding,
+            'text_hash': text_hash(title, author),
+            'norm_key': dedupe_key(*parse_filename(name)),
+            'content_hash': content_hash,
+            'tags': book_tags,
+        })
+    inserted = await asyncio.to_thread(save_books, rows, MODEL_NAME)
+
+    for (path, _), document in zip(chunk, documents):
+        if document is None:
+            continue  # left out of the checkpoint so the next run retries it
+        book_id = inserted.get(document.file_unique_id)
+        entries.append({
+            'path': path,
+            'status': 'imported' if book_id else 'duplicate',
+            'book_id': book_id,
+        })
+    return entries
+
+
+async def run(args):
+    if os.path.isdir(args.source):
+        files = scan_directory(args.source)
+    else:
+        files = scan_telegram_export(args.source)
+
+    done = load_checkpoint(args.checkpoint)
+    pending = [(path, name) for path, name in files if path not in done]
+    print(f"{len(files)} book files found, {len(files) - len(pending)} already imported", flush=True)
+    if not pending:
+        return
+
+    await asyncio.to_thread(init_db)
+    await asyncio.to_thread(init_model)
+
+    bot = None
+    if not args.dry_run:
+        bot = ExtBot(
+            BOT_TOKEN,
+            base_url=TELEGRAM_BASE_URL or 'https://api.telegram.org/bot',
+            rate_limiter=TelegramRateLimiter(chat_rate=args.upload_rate, chat_burst=args.upload_burst)
+        )
+        await bot.initialize()
+    slots = asyncio.Semaphore(args.upload_concurrency)
+
+    counts = {'imported': 0, 'duplicate': 0, 'failed': 0, 'dry-run': 0}
+    started = time.perf_counter()
+    try:
+        for start in range(0, len(pending), args.chunk_size):
+            chunk = pending[start:start + args.chunk_size]
+            entries = await import_chunk(bot, args.chat_id, slots, chunk, args.dry_run)
+            if not args.dry_run:
+                append_checkpoint(args.checkpoint, entries)
+            for entry in entries:
+                counts[entry['status']] += 1
+            counts['failed'] += len(chunk) - len(entries)
+
+            processed = start + len(chunk)
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed
+            eta = (len(pending) - processed) / rate if rate else 0
+            print(
+                f"[{processed}/{len(pending)}] imported {counts['imported']}, "
+                f"duplicates {counts['duplicate']}, failed {counts['failed']} "
+                f"- {rate:.1f} files/s, ETA {eta / 60:.1f} min",
+                flush=True
+            )
+    finally:
+        if bot is not None:
+            await bot.shutdown()
+        extraction_pool.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import PDF/EPUB/MOBI/AZW3/FB2 files")
+    parser.add_argument('source', help="directory of books, or a Telegram Desktop export's result.json")
+    parser.add_argument('--chat-id', type=int, help="chat the bot uploads files to (required unless --dry-run)")
+    parser.add_argument('--checkpoint', default='import-checkpoint.jsonl')
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--upload-concurrency', type=int, default=4)
+    parser.add_argument('--upload-rate', type=float, default=1.0, help="uploads per second to --chat-id")
+    parser.add_argument('--upload-burst', type=int, default=20)
+    parser.add_argument('--dry-run', action='store_true', help="extract and categorize only")
+    args = parser.parse_args()
+
+    if not args.dry_run and (args.chat_id is None or not BOT_TOKEN):
+        parser.error("--chat-id and BOT_TOKEN are required unless --dry-run is given")
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
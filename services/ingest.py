@@ -0,0 +1,222 @@
+"""Ingest workers: turn queued forwarded books into library entries.
+
+handle_document only records an IngestJob and replies "Processing book...";
+workers claim jobs from the database, download, extract, check for
+duplicates, categorize and save, then edit that status message with the
+result. Workers run as tasks inside the bot (INGEST_BOT_WORKERS) and/or as
+separate `python -m services.worker` processes on any machine that can
+reach the database. A job whose worker dies is taken over once its lease
+expires, so a restart never loses a forwarded book.
+"""
+import asyncio
+import os
+from contextlib import AsyncExitStack
+from config import (
+    CATEGORIZE_FROM, DUPLICATE_SIMILARITY, NEIGHBOR_COUNT, INGEST_POLL_SECONDS, INGEST_LEASE_SECONDS,
+    INGEST_MAX_ATTEMPTS, INGEST_RETRY_SECONDS, VECTOR_SYNC_SECONDS
+)
+from bot.keyboards import book_actions, duplicate_choice
+from db.async_operations import (
+    save_book, book_exists, find_duplicates, find_by_content_hash, find_embeddings,
+    claim_job, finish_job, retry_job
+)
+from services import book_cache
+from services.book_cache import BookSnapshot, caption
+from services.download import downloaded
+from services.extraction import extraction_pool
+from services.metadata import file_sha256
+from services.metrics import ingest_stage_seconds
+from services.nlp import categorizer, categorize_embeddings, tag_embeddings, text_hash, is_ready, MODEL_NAME
+from services.vector_index import book_index, sync_book_index
+from services import title_index
+
+# Set when a job is queued by this process, so local workers start at once.
+# Created on first use so it belongs to the running event loop.
+_wake = None
+
+
+def _wake_event():
+    global _wake
+    if _wake is None:
+        _wake = asyncio.Event()
+    return _wake
+
+
+def notify():
+    _wake_event().set()
+
+
+async def _edit(bot, job, text, reply_markup=None):
+    try:
+        await bot.edit_message_text(
+            text, chat_id=job.chat_id, message_id=job.status_message_id, reply_markup=reply_markup
+        )
+    except Exception as e:
+        # The status message may have been deleted; the job result stands
+        print(f"Could not update status for job {job.id}: {e}", flush=True)
+
+
+async def _offer_duplicate(bot, job, existing, reason):
+    await _edit(
+        bot, job,
+        f"This looks like a book already in your library ({reason}):\n\n{caption(existing)}",
+        reply_markup=duplicate_choice(job.id, existing.id)
+    )
+    return 'duplicate', None, existing.id
+
+
+async def ingest(bot, job):
+    """Process one claimed job. Returns (state, book_id, duplicate_of)."""
+    filename = job.file_name
+    check = not job.keep
+
+    # A previous attempt may have saved the book before its worker died
+    if await book_exists(job.file_unique_id):
+        await _edit(bot, job, "This book is already in your library!")
+        return 'done', None, None
+
+    # Same size and normalized filename: ask before downloading anything
+    if check:
+        duplicates = await find_duplicates(job.file_size, job.norm_key)
+        if duplicates:
+            return await _offer_duplicate(bot, job, duplicates[0], "same file name and size")
+
+    # Stream to a temporary file for metadata extraction; errors name the stage that failed
+    stage = 'download'
+    try:
+        async with AsyncExitStack() as stack:
+            with ingest_stage_seconds.time(stage=stage, detail=filename):
+                file = await bot.get_file(job.file_id)
+                path = await stack.enter_async_context(downloaded(file, suffix=os.path.splitext(filename)[1]))
+            stage = 'extract'
+            with ingest_stage_seconds.time(stage=stage, detail=filename):
+                title, author, pages, format = await extraction_pool.extract(path, filename)
+            stage = 'hash'
+            with ingest_stage_seconds.time(stage=stage, detail=filename):
+                content_hash = await asyncio.to_thread(file_sha256, path)
+            sample = ''
+            if CATEGORIZE_FROM == 'content':
+                stage = 'sample'
+                with ingest_stage_seconds.time(stage=stage, detail=filename):
+                    sample = await extraction_pool.sample(path, filename)
+    except Exception as e:
+        raise RuntimeError(f"{stage} failed: {e}") from e
+    title = title or filename
+
+    if check:
+        duplicates = await find_by_content_hash(content_hash)
+        if duplicates:
+            return await _offer_duplicate(bot, job, duplicates[0], "identical file")
+
+    # Auto-categorize; a title already in the library reuses its stored vector
+    book_hash = text_hash(title, author)
+    stored = {}
+    if CATEGORIZE_FROM != 'content' and is_ready():
+        stored = await find_embeddings([book_hash], MODEL_NAME)
+    if book_hash in stored:
+        categorization = categorize_embeddings(stored[book_hash][None, :])[0]
+    else:
+        if is_ready():
+            await _edit(bot, job, "Categorizing...")
+        else:
+            await _edit(bot, job, "Categorizing (language model is still loading)...")
+        with ingest_stage_seconds.time(stage='categorize', detail=filename):
+            categorization = await categorizer.categorize(title, author, sample)
+    category, confidence = categorization.category, categorization.confidence
+    tags = tag_embeddings([categorization.embedding], [(title, author)])[0]
+
+    # Nearest books: the duplicate check and the new book's similarity graph entry
+    matches = await asyncio.to_thread(book_index.search, categorization.embedding, NEIGHBOR_COUNT)
+    if check:
+        if matches and matches[0][1] >= DUPLICATE_SIMILARITY:
+            existing = await book_cache.get_book_snapshot(matches[0][0])
+            if existing:
+                return await _offer_duplicate(bot, job, existing, f"{matches[0][1]:.0%} similar title and author")
+
+    # Save to DB
+    with ingest_stage_seconds.time(stage='save', detail=filename):
+        book_id = await save_book(
+            title=title,
+            author=author,
+            file_id=job.file_id,
+            file_unique_id=job.file_unique_id,
+            format=format,
+            page_count=pages,
+            file_size=job.file_size,
+            category=category,
+            confidence=confidence,
+            embedding=categorization.embedding,
+            text_hash=book_hash,
+            model=MODEL_NAME,
+            norm_key=job.norm_key,
+            content_hash=content_hash,
+            neighbors=matches,
+            tags=tags
+        )
+    book_index.add([book_id], [categorization.embedding])
+    title_index.index_book(book_id, title, author)
+    await book_cache.put(BookSnapshot(book_id, title, author, category, job.file_id))
+
+    # Confirm
+    await _edit(
+        bot, job,
+        f"Added: {title}\n"
+        f"Author: {author or 'Unknown'}\n"
+        f"Category: {category} ({confidence:.0%})\n"
+        f"Pages: {pages or 'N/A'}",
+        reply_markup=book_actions(book_id)
+    )
+    return 'done', book_id, None
+
+
+async def run_job(bot, job):
+    """Process a claimed job and record the outcome; failed attempts are retried with backoff."""
+    if job.attempts > INGEST_MAX_ATTEMPTS:
+        # Its worker died on every attempt
+        await finish_job(job.id, 'failed', error=job.error or "worker lost")
+        await _edit(bot, job, f"Failed to add {job.file_name}.")
+        return
+    try:
+        state, book_id, duplicate_of = await ingest(bot, job)
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back without charging the attempt
+        await asyncio.shield(retry_job(job.id, job.error, 0, charge_attempt=False))
+        raise
+    except Exception as e:
+        print(f"Ingest job {job.id} attempt {job.attempts} failed: {e}", flush=True)
+        if job.attempts >= INGEST_MAX_ATTEMPTS:
+            await finish_job(job.id, 'failed', error=str(e))
+            await _edit(bot, job, f"Failed to add {job.file_name}: {e}")
+        else:
+            await retry_job(job.id, str(e), INGEST_RETRY_SECONDS * job.attempts)
+        return
+    await finish_job(job.id, state, book_id=book_id, duplicate_of=duplicate_of)
+
+
+async def work(bot, name):
+    """Claim and process jobs until cancelled."""
+    wake = _wake_event()
+    while True:
+        wake.clear()
+        try:
+            job = await claim_job(name, INGEST_LEASE_SECONDS)
+        except Exception as e:
+            print(f"Worker {name} could not claim a job: {e}", flush=True)
+            job = None
+        if job is None:
+            try:
+                await asyncio.wait_for(wake.wait(), INGEST_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await run_job(bot, job)
+
+
+async def sync_vectors():
+    """Keep book_index current with books saved by other processes, until cancelled."""
+    while True:
+        await asyncio.sleep(VECTOR_SYNC_SECONDS)
+        try:
+            await asyncio.to_thread(sync_book_index)
+        except Exception as e:
+            print(f"Vector index sync failed: {e}", flush=True)
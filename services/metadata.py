@@ -1,44 +1,79 @@
-import io
+import hashlib
+import html
+import os
 import re
+import struct
+import time
 
+# Upper bound on any XML member read out of an EPUB (container.xml, OPF)
+MAX_XML_BYTES = 1024 * 1024
 
-def extract_pdf_metadata(file_bytes):
-    """Extract metadata from PDF bytes."""
+# MOBI/AZW3 title, author and EXTH records all live in PalmDB record 0
+MAX_MOBI_HEADER_BYTES = 64 * 1024
+# Rough uncompressed text bytes per printed page, for MOBI page estimates
+MOBI_BYTES_PER_PAGE = 2000
+
+EXTH_AUTHOR = 100
+EXTH_ASIN = (113, 504)
+EXTH_TITLE = 503
+
+FB2_NS = '{http://www.gribuser.ru/xml/fictionbook/2.0}'
+
+
+def _pdf_page_count(pdf):
+    """Read /Count from the page-tree root instead of walking every page."""
+    try:
+        return int(pdf.trailer['/Root']['/Pages']['/Count'])
+    except (KeyError, TypeError, ValueError):
+        return len(pdf.pages)
+
+
+def extract_pdf_metadata(fileobj):
+    """Extract metadata from a seekable PDF file object."""
     try:
         import PyPDF2
-        pdf = PyPDF2.PdfReader(io.BytesIO(file_bytes))
+        # Objects are resolved lazily, so only the xref, trailer, Info dict
+        # and page-tree root are read from the file
+        pdf = PyPDF2.PdfReader(fileobj)
         info = pdf.metadata
 
         title = info.get('/Title', '') if info else ''
         author = info.get('/Author', '') if info else ''
-        pages = len(pdf.pages)
+        pages = _pdf_page_count(pdf)
 
         return title, author, pages
     except Exception:
         return '', '', 0
 
 
-def extract_epub_metadata(file_bytes):
-    """Extract metadata from EPUB bytes."""
-    try:
-        import zipfile
-        from xml.etree import ElementTree as ET
+def _read_member(archive, name, limit=MAX_XML_BYTES):
+    with archive.open(name) as member:
+        return member.read(limit)
 
-        with zipfile.ZipFile(io.BytesIO(file_bytes)) as epub:
-            # Find the OPF file
-            container = epub.read('META-INF/container.xml')
-            container_tree = ET.fromstring(container)
 
-            ns = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container'}
-            rootfile = container_tree.find('.//container:rootfile', ns)
-            opf_path = rootfile.get('full-path')
+def _epub_opf(epub):
+    """(path, parsed tree) of the package document named by META-INF/container.xml."""
+    from xml.etree import ElementTree as ET
 
-            # Parse OPF for metadata
-            opf_content = epub.read(opf_path)
-            opf_tree = ET.fromstring(opf_content)
+    container = _read_member(epub, 'META-INF/container.xml')
+    container_tree = ET.fromstring(container)
+
+    ns = {'container': 'urn:oasis:names:tc:opendocument:xmlns:container'}
+    rootfile = container_tree.find('.//container:rootfile', ns)
+    opf_path = rootfile.get('full-path')
+    return opf_path, ET.fromstring(_read_member(epub, opf_path))
 
-            dc_ns = {'dc': 'http://purl.org/dc/elements/1.1/'}
-            opf_ns = {'opf': 'http://www.idpf.org/2007/opf'}
+
+def extract_epub_metadata(fileobj):
+    """Extract metadata from a seekable EPUB file object."""
+    try:
+        import zipfile
+
+        # ZipFile reads the central directory from the end of the file and
+        # then only the members we ask for
+        with zipfile.ZipFile(fileobj) as epub:
+            # Parse OPF for metadata
+            _, opf_tree = _epub_opf(epub)
 
             title_elem = opf_tree.find('.//{http://purl.org/dc/elements/1.1/}title')
             author_elem = opf_tree.find('.//{http://purl.org/dc/elements/1.1/}creator')
@@ -51,6 +86,184 @@ def extract_epub_metadata(file_bytes):
         return '', '', 0
 
 
+def _html_text(markup):
+    markup = re.sub(r'(?is)<(script|style)\b.*?</\1>', ' ', markup)
+    return html.unescape(re.sub(r'<[^>]+>', ' ', markup))
+
+
+def _pdf_text_sample(fileobj, max_pages, max_bytes, max_chars, deadline):
+    import PyPDF2
+
+    pdf = PyPDF2.PdfReader(fileobj)
+    parts, chars, budget = [], 0, max_bytes
+    for index in range(min(max_pages, _pdf_page_count(pdf))):
+        if chars >= max_chars or time.monotonic() > deadline:
+            break
+        page = pdf.pages[index]
+        # Charge the decoded content streams before parsing them for text;
+        # a page that would overrun the budget is not extracted
+        contents = page.get_contents()
+        budget -= len(contents.get_data()) if contents is not None else 0
+        if budget < 0:
+            break
+        text = page.extract_text() or ''
+        parts.append(text)
+        chars += len(text)
+    return ' '.join(parts)
+
+
+def _epub_text_sample(fileobj, max_items, max_bytes, max_chars, deadline):
+    import posixpath
+    import zipfile
+    from urllib.parse import unquote
+
+    opf = '{http://www.idpf.org/2007/opf}'
+    with zipfile.ZipFile(fileobj) as epub:
+        opf_path, opf_tree = _epub_opf(epub)
+        base = posixpath.dirname(opf_path)
+        manifest = {item.get('id'): item.get('href') for item in opf_tree.iter(f'{opf}item')}
+        spine = [itemref.get('idref') for itemref in opf_tree.iter(f'{opf}itemref')]
+
+        parts, chars, budget = [], 0, max_bytes
+        for idref in spine[:max_items]:
+            if chars >= max_chars or budget <= 0 or time.monotonic() > deadline:
+                break
+            href = manifest.get(idref)
+            if not href:
+                continue
+            markup = _read_member(epub, posixpath.join(base, unquote(href)), budget)
+            budget -= len(markup)
+            text = _html_text(markup.decode('utf-8', 'replace'))
+            parts.append(text)
+            chars += len(text)
+    return ' '.join(parts)
+
+
+def extract_text_sample(source, filename, max_pages, max_items, max_bytes, max_chars, seconds):
+    """Up to `max_chars` of body text from the start of a PDF or EPUB, or '' for other formats.
+
+    Reads at most `max_pages` PDF pages or `max_items` EPUB spine items,
+    and at most `max_bytes` of decoded content streams or markup. Stops
+    between pages once `seconds` have passed.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as fileobj:
+            return extract_text_sample(fileobj, filename, max_pages, max_items, max_bytes, max_chars, seconds)
+
+    deadline = time.monotonic() + seconds
+    format = file_format(filename)
+    try:
+        if format == 'pdf':
+            text = _pdf_text_sample(source, max_pages, max_bytes, max_chars, deadline)
+        elif format == 'epub':
+            text = _epub_text_sample(source, max_items, max_bytes, max_chars, deadline)
+        else:
+            return ''
+    except Exception:
+        return ''
+    return ' '.join(text.split())[:max_chars]
+
+
+def read_mobi_header(fileobj):
+    """Parse the PalmDB, MOBI and EXTH headers of a MOBI/AZW3 file.
+
+    Returns a dict with title, author, asin and text_length, or None if
+    the file is not a MOBI book. Only the record list and record 0 are read.
+    """
+    header = fileobj.read(78)
+    if len(header) < 78 or header[60:68] != b'BOOKMOBI':
+        return None
+    record_count, = struct.unpack('>H', header[76:78])
+    if record_count == 0:
+        return None
+    record0_offset, = struct.unpack('>I', fileobj.read(8)[:4])
+    fileobj.seek(record0_offset)
+    record0 = fileobj.read(MAX_MOBI_HEADER_BYTES)
+    if len(record0) < 132 or record0[16:20] != b'MOBI':
+        return None
+
+    text_length, = struct.unpack('>I', record0[4:8])
+    mobi_length, = struct.unpack('>I', record0[20:24])
+    encoding, = struct.unpack('>I', record0[28:32])
+    codec = 'utf-8' if encoding == 65001 else 'cp1252'
+    name_offset, name_length = struct.unpack('>II', record0[84:92])
+    exth_flags, = struct.unpack('>I', record0[128:132])
+
+    book = {
+        'title': record0[name_offset:name_offset + name_length].decode(codec, 'replace'),
+        'author': '',
+        'asin': '',
+        'text_length': text_length,
+    }
+
+    exth = 16 + mobi_length
+    if exth_flags & 0x40 and record0[exth:exth + 4] == b'EXTH':
+        count, = struct.unpack('>I', record0[exth + 8:exth + 12])
+        position = exth + 12
+        for _ in range(count):
+            if position + 8 > len(record0):
+                break
+            kind, length = struct.unpack('>II', record0[position:position + 8])
+            if length < 8:
+                break
+            value = record0[position + 8:position + length].decode(codec, 'replace').strip()
+            if kind == EXTH_AUTHOR:
+                # Several author records: keep them all
+                book['author'] = f"{book['author']} & {value}" if book['author'] else value
+            elif kind == EXTH_TITLE and value:
+                book['title'] = value
+            elif kind in EXTH_ASIN and value:
+                book['asin'] = value
+            position += length
+    return book
+
+
+def extract_mobi_metadata(fileobj):
+    """Extract metadata from a seekable MOBI/AZW3 file object, reading only its headers."""
+    try:
+        book = read_mobi_header(fileobj)
+        if book is None:
+            return '', '', 0
+        pages = -(-book['text_length'] // MOBI_BYTES_PER_PAGE)
+        return book['title'], book['author'], pages
+    except Exception:
+        return '', '', 0
+
+
+def extract_fb2_metadata(fileobj):
+    """Extract metadata from an FB2 file object, parsing no further than </description>."""
+    try:
+        from xml.etree import ElementTree as ET
+
+        title, authors, in_title_info = '', [], False
+        for event, element in ET.iterparse(fileobj, events=('start', 'end')):
+            tag = element.tag.replace(FB2_NS, '')
+            if event == 'start':
+                if tag == 'title-info':
+                    in_title_info = True
+                continue
+            if tag == 'description':
+                break
+            if not in_title_info:
+                continue
+            if tag == 'book-title':
+                title = (element.text or '').strip()
+            elif tag == 'author':
+                parts = [
+                    (element.findtext(f'{FB2_NS}{name}') or '').strip()
+                    for name in ('first-name', 'middle-name', 'last-name')
+                ]
+                name = ' '.join(part for part in parts if part) or (element.findtext(f'{FB2_NS}nickname') or '')
+                if name.strip():
+                    authors.append(name.strip())
+            elif tag == 'title-info':
+                in_title_info = False
+
+        return title, ' & '.join(authors), 0  # FB2 has no page count either
+    except Exception:
+        return '', '', 0
+
+
 def parse_filename(filename):
     """Parse book info from filename patterns."""
     # Remove extension
@@ -75,16 +288,43 @@ def parse_filename(filename):
     return filename.strip(), ''
 
 
-def extract_metadata(file_bytes, filename):
-    """Extract metadata from file, falling back to filename parsing."""
-    format = filename.split('.')[-1].lower() if '.' in filename else ''
+def dedupe_key(title, author=''):
+    """Case-, punctuation- and spacing-insensitive key for spotting the same book."""
+    return ' '.join(re.findall(r'\w+', f"{title} {author or ''}".lower()))
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_format(filename):
+    """Lowercase extension without the dot, or '' if there is none."""
+    return filename.split('.')[-1].lower() if '.' in filename else ''
+
+
+def extract_metadata(source, filename):
+    """Extract metadata from a file path or seekable file object, falling back to filename parsing."""
+    format = file_format(filename)
 
     title, author, pages = '', '', 0
 
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as fileobj:
+            return extract_metadata(fileobj, filename)
+
     if format == 'pdf':
-        title, author, pages = extract_pdf_metadata(file_bytes)
+        title, author, pages = extract_pdf_metadata(source)
     elif format == 'epub':
-        title, author, pages = extract_epub_metadata(file_bytes)
+        title, author, pages = extract_epub_metadata(source)
+    elif format in ('mobi', 'azw3'):
+        title, author, pages = extract_mobi_metadata(source)
+    elif format == 'fb2':
+        title, author, pages = extract_fb2_metadata(source)
 
     # Fallback to filename parsing if no metadata found
     if not title:
@@ -0,0 +1,252 @@
+"""Latency histograms and counters, served in Prometheus text format.
+
+Handlers, ingestion stages, SQL statements, model encodes and Bot API calls
+record into the metrics below; `start_server` exposes them on /metrics.
+Anything slower than SLOW_OP_MS is also printed to the log.
+"""
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import SLOW_OP_MS
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+# Callback data prefixes the bot's buttons send; anything else is labelled
+# 'other', since callback data comes from the client
+CALLBACK_ACTIONS = frozenset({
+    'cat', 'setcat', 'cancel', 'queue', 'read', 'done', 'sim', 'tag', 'browse', 'page', 'show',
+    'dupmerge', 'dupkeep',
+})
+
+_registry = []
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    @contextmanager
+    def time(self, detail=None, **labels):
+        """Observe the duration of the block, logging it if slower than SLOW_OP_MS."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe(elapsed, **labels)
+            log_if_slow(self.name, elapsed, labels, detail)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _label_text(self.labels, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_text(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {counts[-1]}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {counts[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {counts[-1]}")
+        return lines
+
+
+class CacheMetrics:
+    """Hits, misses and size of every watched cache, read from its stats() at scrape time."""
+
+    FIELDS = (
+        ('leibniz_cache_hits_total', 'counter', "Cache lookups that found a value", 'hits'),
+        ('leibniz_cache_misses_total', 'counter', "Cache lookups that found nothing", 'misses'),
+        ('leibniz_cache_items', 'gauge', "Entries held by in-process caches", 'size'),
+    )
+
+    def __init__(self):
+        self._caches = []
+        _registry.append(self)
+
+    def watch(self, name, cache):
+        self._caches.append((name, cache))
+
+    def render(self):
+        stats = [(name, cache.stats()) for name, cache in self._caches]
+        lines = []
+        for metric, kind, help, field in self.FIELDS:
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+            for name, values in stats:
+                if field in values:
+                    lines.append(f'{metric}{{cache="{name}"}} {values[field]}')
+        return lines
+
+
+def log_if_slow(name, seconds, labels=None, detail=None):
+    if seconds * 1000 < SLOW_OP_MS:
+        return
+    message = ' '.join([f"Slow {name}"] + [f"{key}={value}" for key, value in (labels or {}).items()])
+    message += f" {seconds * 1000:.0f} ms"
+    if detail:
+        message += f": {detail}"
+    print(message, flush=True)
+
+
+handler_seconds = Histogram(
+    'leibniz_handler_seconds', "Time to handle one update, by handler and callback action",
+    labels=('handler', 'action')
+)
+ingest_stage_seconds = Histogram(
+    'leibniz_ingest_stage_seconds', "Time spent in each stage of adding a forwarded book", labels=('stage',)
+)
+db_query_seconds = Histogram(
+    'leibniz_db_query_seconds', "SQL statement execution time, by statement type", labels=('statement',)
+)
+encode_seconds = Histogram('leibniz_encode_seconds', "Language model encode call time")
+encode_batch_size = Histogram(
+    'leibniz_encode_batch_size', "Texts per language model encode call", buckets=SIZE_BUCKETS
+)
+telegram_request_seconds = Histogram(
+    'leibniz_telegram_request_seconds', "Bot API call latency, by method", labels=('method',)
+)
+telegram_responses = Counter(
+    'leibniz_telegram_responses_total', "Bot API responses, by method and HTTP status", labels=('method', 'status')
+)
+cache_metrics = CacheMetrics()
+
+
+def watch_cache(name, cache):
+    """Export a cache's hit and miss counts (and size, in memory) as cache=`name`."""
+    cache_metrics.watch(name, cache)
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def timed_handler(handler):
+    """Decorate a telegram handler to record its latency, by callback action for button presses."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(update, context):
+            query = update.callback_query
+            action = query.data.split('_', 1)[0] if query and query.data else ''
+            if action and action not in CALLBACK_ACTIONS:
+                action = 'other'
+            with handler_seconds.time(handler=handler, action=action):
+                return await fn(update, context)
+        return wrapper
+    return decorator
+
+
+def instrument_engine(engine):
+    """Time every SQL statement `engine` executes."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    @event.listens_for(engine, 'handle_error')
+    def _failed(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None:
+            context.connection.info.pop('query_started', None)
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('query_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        kind = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        db_query_seconds.observe(elapsed, statement=kind)
+        log_if_slow('query', elapsed, detail=' '.join(statement.split())[:300])
+
+
+def telegram_request(**kwargs):
+    """An HTTPXRequest that records the latency and status of every Bot API call."""
+    from telegram.request import HTTPXRequest
+
+    class TimedRequest(HTTPXRequest):
+        async def do_request(self, url, method, *args, **kw):
+            api_method = url.rsplit('/', 1)[-1]
+            status = 'error'
+            with telegram_request_seconds.time(method=api_method):
+                try:
+                    status, payload = await super().do_request(url, method, *args, **kw)
+                    return status, payload
+                finally:
+                    telegram_responses.inc(method=api_method, status=status)
+
+    return TimedRequest(**kwargs)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(host, port):
+    """Serve /metrics from a daemon thread. Returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
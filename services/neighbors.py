@@ -0,0 +1,65 @@
+"""Rebuild the similar-books graph from the stored embeddings.
+
+    python -m services.neighbors
+
+New books are linked into the graph as they are saved; run this after a
+bulk import, `services.recategorize --backfill`, or a NEIGHBOR_COUNT
+change. Embeddings are compared chunk against chunk, keeping a running
+top k per book, so the full similarity matrix is never materialized.
+"""
+import argparse
+import time
+import numpy as np
+from config import NEIGHBOR_COUNT
+from db.operations import iter_embedding_chunks, replace_neighbors
+from services.nlp import MODEL_NAME
+
+CHUNK_SIZE = 4096
+
+
+def top_neighbors(left_ids, left, chunks, k):
+    """{book_id: [(book_id, score), ...]} for the rows of `left` against every chunk."""
+    best_scores = np.full((len(left_ids), 0), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(left_ids), 0), dtype=np.int64)
+    for right_ids, right in chunks:
+        scores = left @ right.T
+        scores[left_ids[:, None] == right_ids[None, :]] = -np.inf  # not its own neighbor
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(right_ids, (len(left_ids), len(right_ids)))], axis=1)
+        keep = min(k, scores.shape[1])
+        top = np.argpartition(-scores, keep - 1, axis=1)[:, :keep]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+
+    graph = {}
+    order = np.argsort(-best_scores, axis=1)
+    for row, book_id in enumerate(left_ids):
+        graph[int(book_id)] = [
+            (int(best_ids[row, column]), float(best_scores[row, column]))
+            for column in order[row] if np.isfinite(best_scores[row, column])
+        ]
+    return graph
+
+
+def rebuild(k=NEIGHBOR_COUNT, chunk_size=CHUNK_SIZE):
+    chunks = list(iter_embedding_chunks(chunk_size, model=MODEL_NAME))
+    total = 0
+    for left_ids, left in chunks:
+        replace_neighbors(top_neighbors(left_ids, left, chunks, k))
+        total += len(left_ids)
+        print(f"Linked {total} books", flush=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the similar-books graph")
+    parser.add_argument('--k', type=int, default=NEIGHBOR_COUNT, help="neighbors kept per book")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    total = rebuild(args.k)
+    print(f"Rebuilt neighbors for {total} books in {time.perf_counter() - started:.1f}s", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,260 @@
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from config import CATEGORIES
+import asyncio
+import hashlib
+import re
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from config import (
+    CATEGORIES, TAG_VOCABULARY, TAG_THRESHOLD, MAX_TAGS_PER_BOOK, NLP_BATCH_WINDOW_MS, NLP_MAX_BATCH, NLP_TOP_K,
+    SAMPLE_CHUNK_CHARS
+)
+from services.metrics import encode_seconds, encode_batch_size
 
-# Load model once at startup
+MODEL_NAME = 'all-MiniLM-L6-v2'
+CONFIDENCE_THRESHOLD = 0.4
+
+# Loaded once, in the background after startup (see CategorizeBatcher.warm_up)
 model = None
-category_embeddings = None
+category_names = None
+category_matrix = None  # (n_categories, dim), rows L2-normalized
+tag_names = None
+tag_matrix = None  # (n_tags, dim), rows L2-normalized
+_ready = False
+
+# ranked: [(category, score), ...] best first; embedding: normalized float32 vector
+Categorization = namedtuple('Categorization', ['category', 'confidence', 'ranked', 'embedding'])
 
 
 def init_model():
-    global model, category_embeddings
+    global model, category_names, category_matrix, tag_names, tag_matrix, _ready
     if model is None:
-        model = SentenceTransformer('all-MiniLM-L6-v2')
-        category_embeddings = {
-            cat: model.encode(desc) for cat, desc in CATEGORIES.items()
-        }
+        # Deferred: importing sentence_transformers pulls in torch
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(MODEL_NAME)
+        category_names = list(CATEGORIES.keys())
+        category_matrix = encode(list(CATEGORIES.values()))
+        tag_names = list(TAG_VOCABULARY.keys())
+        tag_matrix = encode(list(TAG_VOCABULARY.values())) if tag_names else None
+        _ready = True
 
 
-def categorize_book(title, author=""):
+def is_ready():
+    """True once the model and category matrix are loaded."""
+    return _ready
+
+
+def encode(texts):
+    """Encode a list of texts into L2-normalized float32 rows."""
+    encode_batch_size.observe(len(texts))
+    with encode_seconds.time(detail=f"{len(texts)} texts"):
+        return model.encode(
+            texts, batch_size=NLP_MAX_BATCH, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+
+def _encode_one(text):
+    init_model()
+    return encode([text])[0]
+
+
+def book_text(title, author=""):
+    return f"{title} {author or ''}"
+
+
+def text_hash(title, author=""):
+    """Key for a stored embedding: sha1 of the case- and whitespace-normalized book text."""
+    normalized = ' '.join(book_text(title, author).lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def rank_embeddings(embeddings, top_k=NLP_TOP_K):
+    """Score normalized embeddings against every category with one matrix multiply."""
+    init_model()
+    scores = embeddings @ category_matrix.T
+    top_k = min(top_k, len(category_names))
+    # argpartition + sort of k columns instead of a full sort per row
+    top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    rows = np.arange(len(scores))[:, None]
+    order = np.argsort(-scores[rows, top], axis=1)
+    top = top[rows, order]
+    return [
+        [(category_names[j], float(scores[i, j])) for j in top[i]]
+        for i in range(len(scores))
+    ]
+
+
+def categorize_embeddings(embeddings, top_k=NLP_TOP_K):
+    results = []
+    for embedding, ranked in zip(embeddings, rank_embeddings(embeddings, top_k)):
+        best_category, confidence = ranked[0]
+        if confidence < CONFIDENCE_THRESHOLD:
+            best_category = "Uncategorized"
+        results.append(Categorization(best_category, confidence, ranked, embedding))
+    return results
+
+
+def _phrase(text):
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+# Phrases that put a book in a tag when found as whole words in its title or author
+TAG_KEYWORDS = {
+    name: {_phrase(phrase) for phrase in [name, *keywords.split(',')] if _phrase(phrase)}
+    for name, keywords in TAG_VOCABULARY.items()
+}
+
+
+def tag_embeddings(embeddings, books, threshold=TAG_THRESHOLD, limit=MAX_TAGS_PER_BOOK):
+    """Tags for each (title, author) in `books`: keyword hits and close tag embeddings, by similarity."""
     init_model()
+    if not tag_names:
+        return [[] for _ in books]
+    scores = np.asarray(embeddings, dtype=np.float32).reshape(len(books), -1) @ tag_matrix.T
+    results = []
+    for (title, author), row in zip(books, scores):
+        text = f" {_phrase(book_text(title, author))} "
+        results.append([
+            tag_names[j] for j in np.argsort(-row)
+            if row[j] >= threshold or any(f" {phrase} " in text for phrase in TAG_KEYWORDS[tag_names[j]])
+        ][:limit])
+    return results
+
+
+def chunk_text(text, size=SAMPLE_CHUNK_CHARS):
+    """Split text into chunks of about `size` characters on word boundaries."""
+    chunks, current, length = [], [], 0
+    for word in text.split():
+        if length + len(word) > size and current:
+            chunks.append(' '.join(current))
+            current, length = [], 0
+        current.append(word)
+        length += len(word) + 1
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+def categorize_many(books, top_k=NLP_TOP_K, samples=None):
+    """Categorize a list of (title, author) pairs with a single encode call.
+
+    With `samples` (text per book, '' for none) each book's sample chunks
+    are encoded in the same batch. Categories are scored against the title
+    vector plus the mean of the chunk vectors, so the title weighs as much
+    as the whole sample. The returned embedding is always the title vector.
+    """
+    if not books:
+        return []
+    init_model()
+    texts = [book_text(title, author) for title, author in books]
+    if not samples or not any(samples):
+        return categorize_embeddings(encode(texts), top_k)
+
+    spans = []
+    for sample in samples:
+        chunks = chunk_text(sample or '')
+        spans.append((len(texts), len(texts) + len(chunks)))
+        texts.extend(chunks)
+    vectors = encode(texts)
+    titles = vectors[:len(books)]
+    pooled = titles.copy()
+    for row, (start, end) in enumerate(spans):
+        if end > start:
+            pooled[row] += vectors[start:end].mean(axis=0)
+    pooled /= np.linalg.norm(pooled, axis=1, keepdims=True)
+    return [
+        result._replace(embedding=title)
+        for result, title in zip(categorize_embeddings(pooled, top_k), titles)
+    ]
+
+
+def categorize_reusing(books, stored, top_k=NLP_TOP_K):
+    """categorize_many, scoring books whose text_hash is in `stored` ({text_hash: vector}) without encoding."""
+    hashes = [text_hash(title, author) for title, author in books]
+    reused = [i for i, key in enumerate(hashes) if key in stored]
+    encoded = [i for i, key in enumerate(hashes) if key not in stored]
+    results = [None] * len(books)
+    if reused:
+        matrix = np.stack([stored[hashes[i]] for i in reused])
+        for i, result in zip(reused, categorize_embeddings(matrix, top_k)):
+            results[i] = result
+    for i, result in zip(encoded, categorize_many([books[i] for i in encoded], top_k)):
+        results[i] = result
+    return results
+
+
+def categorize_book(title, author=""):
+    result = categorize_many([(title, author)])[0]
+    return result.category, result.confidence
+
+
+class CategorizeBatcher:
+    """Coalesces concurrent categorize requests into one encode call.
+
+    Requests arriving within `window` seconds of the first pending one (or
+    until `max_batch` is reached) are encoded together on a single model
+    thread, so a burst of forwarded books costs one forward pass.
+    """
+
+    def __init__(self, window, max_batch, top_k):
+        self.window = window
+        self.max_batch = max_batch
+        self.top_k = top_k
+        self._pending = []
+        self._timer = None
+        self._tasks = set()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='nlp')
+
+    async def embed(self, text):
+        """Encode one free-text query on the model thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _encode_one, text)
+
+    def warm_up(self):
+        """Load the model on the model thread without blocking the caller."""
+        return asyncio.get_running_loop().run_in_executor(self._executor, init_model)
+
+    async def categorize(self, title, author="", sample=''):
+        """Return a Categorization for one book, optionally informed by a text sample."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((title, author), sample, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
 
-    text = f"{title} {author}"
-    book_embedding = model.encode(text)
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
 
-    similarities = {
-        cat: cosine_similarity([book_embedding], [emb])[0][0]
-        for cat, emb in category_embeddings.items()
-    }
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        books = [book for book, _, _ in batch]
+        samples = [sample for _, sample, _ in batch]
+        try:
+            results = await loop.run_in_executor(self._executor, categorize_many, books, self.top_k, samples)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
 
-    best_category = max(similarities, key=similarities.get)
-    confidence = similarities[best_category]
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
-    if confidence < 0.4:
-        return "Uncategorized", float(confidence)
 
-    return best_category, float(confidence)
+categorizer = CategorizeBatcher(
+    window=NLP_BATCH_WINDOW_MS / 1000,
+    max_batch=NLP_MAX_BATCH,
+    top_k=NLP_TOP_K
+)
@@ -0,0 +1,102 @@
+"""Reassign every book's category (and optionally tags) from its stored embedding.
+
+Run after editing config.CATEGORIES or config.TAG_VOCABULARY:
+
+    python -m services.recategorize [--backfill] [--tags]
+
+Only the category and tag descriptions are re-encoded; books are scored
+against them in chunks straight from the stored vectors. Use --backfill
+once to embed books that were added before embeddings were stored, and
+--tags to replace every book's tags. Vectors from a model other than
+MODEL_NAME are skipped; --backfill re-embeds them.
+
+The stored vectors are title vectors. With CATEGORIZE_FROM=content,
+categories were scored from text samples that are not stored, so they are
+left alone unless --from-titles is given; --tags still retags.
+"""
+import argparse
+import time
+from config import CATEGORIZE_FROM
+from db.operations import (
+    iter_embedding_chunks, bulk_update_categories,
+    get_books_without_embeddings, save_embeddings, get_books, replace_tags, find_embeddings
+)
+from services import book_cache
+from services.nlp import init_model, categorize_reusing, categorize_embeddings, tag_embeddings, text_hash, MODEL_NAME
+
+CHUNK_SIZE = 10000
+BACKFILL_BATCH = 256
+
+
+def backfill():
+    """Embed books with no vector, or one from another model; a stored vector of the same text is reused."""
+    total = 0
+    while True:
+        books = get_books_without_embeddings(BACKFILL_BATCH, MODEL_NAME)
+        if not books:
+            return total
+        pairs = [(book.title, book.author) for book in books]
+        stored = find_embeddings([text_hash(*pair) for pair in pairs], MODEL_NAME)
+        results = categorize_reusing(pairs, stored)
+        save_embeddings([
+            (book.id, text_hash(book.title, book.author), result.embedding)
+            for book, result in zip(books, results)
+        ], MODEL_NAME)
+        total += len(books)
+        print(f"Embedded {total} books", flush=True)
+
+
+def recategorize(categories=True, retag=False):
+    total = 0
+    for ids, matrix in iter_embedding_chunks(CHUNK_SIZE, model=MODEL_NAME):
+        if categories:
+            results = categorize_embeddings(matrix)
+            bulk_update_categories([
+                (int(book_id), result.category, result.confidence)
+                for book_id, result in zip(ids, results)
+            ])
+        if retag:
+            books = {book.id: book for book in get_books([int(book_id) for book_id in ids])}
+            tags = tag_embeddings(matrix, [
+                (books[book_id].title, books[book_id].author) if book_id in books else ('', '')
+                for book_id in ids.tolist()
+            ])
+            replace_tags({book_id: book_tags for book_id, book_tags in zip(ids.tolist(), tags) if book_id in books})
+        total += len(ids)
+        print(f"{'Recategorized' if categories else 'Retagged'} {total} books", flush=True)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reassign categories from stored book embeddings")
+    parser.add_argument(
+        '--backfill', action='store_true', help="embed books with no stored vector (or a stale one) first"
+    )
+    parser.add_argument('--tags', action='store_true', help="also replace every book's tags")
+    parser.add_argument(
+        '--from-titles', action='store_true',
+        help="with CATEGORIZE_FROM=content, replace content-based categories with title-only ones"
+    )
+    args = parser.parse_args()
+
+    categories = CATEGORIZE_FROM != 'content' or args.from_titles
+    if not categories:
+        if not args.tags and not args.backfill:
+            parser.error(
+                "CATEGORIZE_FROM=content: stored vectors are title-only, so rescoring would drop the "
+                "content-based categories. Pass --from-titles to do it anyway, or --tags to only retag"
+            )
+        print("CATEGORIZE_FROM=content: keeping categories (pass --from-titles to rescore them)", flush=True)
+
+    started = time.perf_counter()
+    init_model()
+    if args.backfill:
+        backfill()
+    total = recategorize(categories=categories, retag=args.tags)
+    # Drops shared (Redis) snapshots; per-process caches expire after CACHE_TTL
+    book_cache.clear()
+    print(f"Done: {total} books in {time.perf_counter() - started:.1f}s", flush=True)
+
+
+if __name__ == '__main__':
+    main()
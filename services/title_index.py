@@ -0,0 +1,197 @@
+"""In-memory word index over book titles and authors for inline search.
+
+Every title and author word maps to the books containing it. A sorted
+vocabulary answers prefix lookups with bisect, so "pyth" matches "python"
+while it is being typed, and a trigram index over the vocabulary finds
+words that are close when a word matches nothing ("pyhton"). Books are
+added as they are saved and picked up from other processes by
+sync_title_index; nothing here touches the database on a query.
+"""
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+# Words with at least this trigram (Jaccard) similarity stand in for a query
+# word that is not a prefix of any indexed word
+FUZZY_SIMILARITY = 0.25
+FUZZY_WORDS = 5
+# A title match counts this many times an author match
+TITLE_WEIGHT = 2
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text):
+    """Lowercase, accent-free words of `text`."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD.findall(text.casefold())
+
+
+def normalize_query(query):
+    return ' '.join(normalize(query))
+
+
+def _trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    def __init__(self):
+        self._books = {}  # book_id -> (title, author)
+        self._postings = defaultdict(dict)  # word -> {book_id: weight}
+        self._vocabulary = []  # sorted words
+        self._trigram_words = defaultdict(set)  # trigram -> words
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._books)
+
+    def _book_words(self, title, author):
+        words = {word: 1 for word in normalize(author)}
+        words.update((word, TITLE_WEIGHT) for word in normalize(title))
+        return words
+
+    def _add_word(self, word):
+        bisect.insort(self._vocabulary, word)
+        for trigram in _trigrams(word):
+            self._trigram_words[trigram].add(word)
+
+    def _drop_word(self, word):
+        del self._postings[word]
+        del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+        for trigram in _trigrams(word):
+            words = self._trigram_words[trigram]
+            words.discard(word)
+            if not words:
+                del self._trigram_words[trigram]
+
+    def add(self, book_id, title, author):
+        """Index a book, replacing any earlier entry for it."""
+        book_id = int(book_id)
+        with self._lock:
+            self.remove(book_id)
+            self._books[book_id] = (title, author)
+            for word, weight in self._book_words(title, author).items():
+                if word not in self._postings:
+                    self._add_word(word)
+                self._postings[word][book_id] = weight
+
+    def add_many(self, rows):
+        """Index (book_id, title, author) rows; the vocabulary is re-sorted once."""
+        with self._lock:
+            new_words = []
+            for book_id, entry in {int(row[0]): tuple(row[1:]) for row in rows}.items():
+                if book_id in self._books:
+                    if self._books[book_id] != entry:
+                        self.add(book_id, *entry)
+                    continue
+                title, author = entry
+                self._books[book_id] = entry
+                for word, weight in self._book_words(title, author).items():
+                    if word not in self._postings:
+                        new_words.append(word)
+                    self._postings[word][book_id] = weight
+            # Sort the vocabulary once rather than inserting each new word
+            for word in new_words:
+                for trigram in _trigrams(word):
+                    self._trigram_words[trigram].add(word)
+            if new_words:
+                self._vocabulary = sorted(self._postings)
+
+    def remove(self, book_id):
+        with self._lock:
+            entry = self._books.pop(int(book_id), None)
+            if entry is None:
+                return
+            for word in self._book_words(*entry):
+                postings = self._postings[word]
+                postings.pop(int(book_id), None)
+                if not postings:
+                    self._drop_word(word)
+
+    def _prefixed(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\U0010ffff', start)
+        return self._vocabulary[start:end]
+
+    def _similar(self, word):
+        """[(word, similarity)] for the closest vocabulary words by shared trigrams."""
+        trigrams = _trigrams(word)
+        shared = defaultdict(int)
+        for trigram in trigrams:
+            for candidate in self._trigram_words.get(trigram, ()):
+                shared[candidate] += 1
+        scored = [
+            (candidate, count / (len(trigrams) + len(_trigrams(candidate)) - count))
+            for candidate, count in shared.items()
+        ]
+        return heapq.nlargest(
+            FUZZY_WORDS, [item for item in scored if item[1] >= FUZZY_SIMILARITY], key=lambda item: item[1]
+        )
+
+    def _matches(self, word):
+        """{book_id: score} for books with a word that is, starts with, or resembles `word`."""
+        scores = {}
+        candidates = [(match, 1.0 if match == word else 0.8) for match in self._prefixed(word)]
+        if not candidates and len(word) >= 3:
+            candidates = [(match, 0.6 * similarity) for match, similarity in self._similar(word)]
+        for match, quality in candidates:
+            for book_id, weight in self._postings[match].items():
+                score = quality * weight
+                if score > scores.get(book_id, 0):
+                    scores[book_id] = score
+        return scores
+
+    def search(self, query, limit=50):
+        """Book ids matching every word of `query`, best first; the newest books for an empty query."""
+        with self._lock:
+            words = normalize(query)
+            if not words:
+                return heapq.nlargest(limit, self._books)
+            # Rarest word first, so the intersection shrinks quickly
+            per_word = sorted((self._matches(word) for word in dict.fromkeys(words)), key=len)
+            scores = dict(per_word[0])
+            for matches in per_word[1:]:
+                scores = {book_id: score + matches[book_id] for book_id, score in scores.items() if book_id in matches}
+                if not scores:
+                    return []
+            return heapq.nsmallest(
+                limit, scores, key=lambda book_id: (-scores[book_id], len(self._books[book_id][0]), -book_id)
+            )
+
+
+title_index = TitleIndex()
+
+# Same overlap as the vector index: ids are assigned before commit
+SYNC_OVERLAP = 1000
+_synced_through = 0
+# Only processes that serve inline queries load the index
+_loaded = False
+
+
+def sync_title_index():
+    """Index books stored since the last sync, e.g. by ingest workers. Returns the index size."""
+    global _synced_through
+    from db.operations import iter_book_titles
+    for rows in iter_book_titles(after_id=max(0, _synced_through - SYNC_OVERLAP)):
+        title_index.add_many(rows)
+        _synced_through = max(_synced_through, rows[-1][0])
+    return len(title_index)
+
+
+def load_title_index():
+    """Fill title_index from the library. Returns the number of books."""
+    global _loaded
+    _loaded = True
+    return sync_title_index()
+
+
+def index_book(book_id, title, author):
+    """Add a just-saved book if this process serves inline queries; standalone workers skip it."""
+    if _loaded:
+        title_index.add(book_id, title, author)
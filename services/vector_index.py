@@ -0,0 +1,124 @@
+"""In-memory nearest-neighbour index over book embeddings.
+
+The default backend keeps every vector in one contiguous float32 matrix and
+answers exact top-k with a single matrix-vector product. Other backends (for
+example an HNSW graph) only need the same add/remove/search/__len__ methods
+and an entry in BACKENDS.
+"""
+import threading
+import numpy as np
+from config import VECTOR_INDEX_BACKEND
+
+
+class BruteForceIndex:
+    def __init__(self, initial_capacity=1024):
+        self._initial_capacity = initial_capacity
+        self._matrix = None  # (capacity, dim); rows [0, _size) are live
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._positions = {}
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, dim, needed):
+        if self._matrix is None:
+            capacity = max(self._initial_capacity, needed)
+            self._matrix = np.empty((capacity, dim), dtype=np.float32)
+            self._ids = np.empty(capacity, dtype=np.int64)
+        elif needed > len(self._matrix):
+            capacity = max(needed, 2 * len(self._matrix))
+            matrix = np.empty((capacity, dim), dtype=np.float32)
+            matrix[:self._size] = self._matrix[:self._size]
+            ids = np.empty(capacity, dtype=np.int64)
+            ids[:self._size] = self._ids[:self._size]
+            self._matrix, self._ids = matrix, ids
+
+    def add(self, ids, vectors):
+        """Insert or replace vectors; rows must already be L2-normalized."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1)
+        self._reserve(vectors.shape[1], self._size + len(ids))
+        for book_id, vector in zip(ids, vectors):
+            book_id = int(book_id)
+            position = self._positions.get(book_id)
+            if position is None:
+                position = self._size
+                self._size += 1
+                self._positions[book_id] = position
+                self._ids[position] = book_id
+            self._matrix[position] = vector
+
+    def remove(self, book_id):
+        position = self._positions.pop(int(book_id), None)
+        if position is None:
+            return
+        # Keep rows contiguous by moving the last row into the hole
+        last = self._size - 1
+        if position != last:
+            moved_id = int(self._ids[last])
+            self._matrix[position] = self._matrix[last]
+            self._ids[position] = moved_id
+            self._positions[moved_id] = position
+        self._size = last
+
+    def search(self, query, k):
+        """Return [(book_id, score), ...] for the k most similar vectors."""
+        if self._size == 0:
+            return []
+        scores = self._matrix[:self._size] @ np.asarray(query, dtype=np.float32)
+        k = min(k, self._size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self._ids[i]), float(scores[i])) for i in top]
+
+
+BACKENDS = {
+    'bruteforce': BruteForceIndex,
+}
+
+
+class VectorIndex:
+    """Thread-safe wrapper so searches can run off the event loop."""
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._backend)
+
+    def add(self, ids, vectors):
+        with self._lock:
+            self._backend.add(ids, vectors)
+
+    def remove(self, book_id):
+        with self._lock:
+            self._backend.remove(book_id)
+
+    def search(self, query, k=10):
+        with self._lock:
+            return self._backend.search(query, k)
+
+
+book_index = VectorIndex(BACKENDS[VECTOR_INDEX_BACKEND]())
+
+# Ids are assigned before commit, so a book saved concurrently elsewhere can
+# become visible after a higher id; each sync rescans this many ids back
+SYNC_OVERLAP = 1000
+_synced_through = 0
+
+
+def sync_book_index():
+    """Add embeddings stored since the last sync, e.g. by ingest workers. Returns the index size."""
+    global _synced_through
+    from db.operations import iter_embedding_chunks
+    from services.nlp import MODEL_NAME
+    for ids, matrix in iter_embedding_chunks(after_id=max(0, _synced_through - SYNC_OVERLAP), model=MODEL_NAME):
+        book_index.add(ids, matrix)
+        _synced_through = max(_synced_through, int(ids[-1]))
+    return len(book_index)
+
+
+def load_book_index():
+    """Fill book_index from the stored embeddings. Returns the number of vectors."""
+    return sync_book_index()
@@ -0,0 +1,86 @@
+"""Run ingest workers in their own process.
+
+    python -m services.worker --concurrency 4
+    python -m services.worker --name books-2 --metrics-port 9101
+
+Workers claim queued books from the database shared with the bot, so any
+number of these processes can run on any machine that can reach it. Set
+INGEST_BOT_WORKERS=0 on the bot to leave all ingestion to them. Stop with
+Ctrl+C or SIGTERM; jobs in progress are handed back to the queue.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+from telegram.ext import ExtBot
+from config import BOT_TOKEN, TELEGRAM_BASE_URL, METRICS_HOST
+from bot.delivery import TelegramRateLimiter
+from db import async_operations
+from db.operations import engine
+from services import download, metrics
+from services.extraction import extraction_pool
+from services.ingest import work, sync_vectors
+from services.nlp import categorizer
+from services.vector_index import load_book_index
+
+
+async def run(args):
+    await async_operations.init_db()
+    warm_up = categorizer.warm_up()
+    count = await asyncio.to_thread(load_book_index)
+    print(f"Loaded {count} book vectors", flush=True)
+
+    bot = ExtBot(
+        BOT_TOKEN,
+        base_url=TELEGRAM_BASE_URL or 'https://api.telegram.org/bot',
+        request=metrics.telegram_request(connection_pool_size=max(8, 2 * args.concurrency)),
+        rate_limiter=TelegramRateLimiter()
+    )
+    await bot.initialize()
+
+    tasks = [asyncio.create_task(sync_vectors())] + [
+        asyncio.create_task(work(bot, f"{args.name}-{i}")) for i in range(args.concurrency)
+    ]
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Worker {args.name} running {args.concurrency} jobs at a time", flush=True)
+    try:
+        try:
+            await warm_up
+            print("Language model ready", flush=True)
+        except Exception as e:
+            print(f"Model warm-up failed: {e}", flush=True)
+        await stop.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await bot.shutdown()
+        await download.close()
+        categorizer.shutdown()
+        extraction_pool.shutdown()
+        async_operations.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process queued books")
+    parser.add_argument('--concurrency', type=int, default=4, help="jobs processed at once")
+    parser.add_argument('--name', default=f"{socket.gethostname()}-{os.getpid()}", help="worker name in the job table")
+    parser.add_argument('--metrics-port', type=int, default=0, help="serve /metrics on this port")
+    args = parser.parse_args()
+
+    if not BOT_TOKEN:
+        parser.error("BOT_TOKEN is required to fetch files and update status messages")
+
+    metrics.instrument_engine(engine)
+    if args.metrics_port:
+        metrics.start_server(METRICS_HOST, args.metrics_port)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()